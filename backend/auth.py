@@ -1,25 +1,189 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import models
-from database import get_db
+from database import get_async_db
 
 SECRET_KEY = "zwy-project-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30天
 
+# 用户身份缓存配置
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+
+# 密码哈希线程池大小，即同时进行的bcrypt计算数量上限
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+class CachedUser:
+    """缓存的用户身份信息，不包含密码等敏感字段"""
+    __slots__ = ("id", "username", "name", "role", "password_changed")
+    
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.name = user.name
+        self.role = user.role
+        self.password_changed = user.password_changed
+
+class UserIdentityCache:
+    """按令牌主体(用户名)缓存用户身份，容量有上限(LRU)且条目有过期时间(TTL)"""
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, username: str) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self.misses += 1
+                return None
+            identity, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return identity
+    
+    def set(self, username: str, identity: CachedUser):
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (identity, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, username: str):
+        with self._lock:
+            if self._entries.pop(username, None) is not None:
+                self.invalidations += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+user_cache = UserIdentityCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+def invalidate_cached_user(username: str):
+    """用户密码重置或删除后，清除其缓存的身份信息"""
+    user_cache.invalidate(username)
+
+class PasswordHashStats:
+    """密码哈希任务统计：排队等待时间和执行时间"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.running = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+    
+    def record_submit(self):
+        with self._lock:
+            self.submitted += 1
+    
+    def record_start(self, queue_wait: float):
+        with self._lock:
+            self.running += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+    
+    def record_finish(self, run_time: float):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.run_time_total += run_time
+            self.run_time_max = max(self.run_time_max, run_time)
+    
+    def snapshot(self):
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": PASSWORD_HASH_WORKERS,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "running": self.running,
+                "queued": self.submitted - started,
+                "queue_wait_avg_ms": round(self.queue_wait_total / started * 1000, 2) if started else 0.0,
+                "queue_wait_max_ms": round(self.queue_wait_max * 1000, 2),
+                "run_time_avg_ms": round(self.run_time_total / self.completed * 1000, 2) if self.completed else 0.0,
+                "run_time_max_ms": round(self.run_time_max * 1000, 2)
+            }
+
+password_hash_stats = PasswordHashStats()
+
+# bcrypt计算会释放GIL，放到独立的线程池中执行既能利用多核，又不会阻塞事件循环
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def _submit_password_task(func, *args):
+    submitted_at = time.perf_counter()
+    password_hash_stats.record_submit()
+    
+    def run():
+        started_at = time.perf_counter()
+        password_hash_stats.record_start(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            password_hash_stats.record_finish(time.perf_counter() - started_at)
+    
+    return _password_executor.submit(run)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _submit_password_task(pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _submit_password_task(pwd_context.hash, password).result()
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.wrap_future(_submit_password_task(pwd_context.verify, plain_password, hashed_password))
+
+async def get_password_hash_async(password):
+    return await asyncio.wrap_future(_submit_password_task(pwd_context.hash, password))
 
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(models.User).filter(models.User.username == username).first()
@@ -29,6 +193,17 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(db: Session, username: str, password: str):
+    """异步版本的authenticate_user，数据库查询和密码校验都不阻塞事件循环"""
+    user = await run_in_threadpool(
+        lambda: db.query(models.User).filter(models.User.username == username).first()
+    )
+    if not user:
+        return False
+    if not await verify_password_async(password, user.password):
+        return False
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -39,7 +214,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="凭证验证失败",
@@ -52,7 +227,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+    
+    identity = user_cache.get(username)
+    if identity is not None:
+        return identity
+    
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    identity = CachedUser(user)
+    user_cache.set(username, identity)
+    return identity
\ No newline at end of file
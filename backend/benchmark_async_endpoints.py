@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+异步数据库接口并发基准测试
+在临时目录中创建测试数据库，用多个并发客户端同时请求房间状态更新和质量问题列表接口，
+另有一个探测任务持续请求根路径，统计各类请求的p50/p99延迟。
+对比两种实现：
+    旧实现：async def 接口中直接使用同步Session（每次提交都会阻塞事件循环），列表接口在线程池中执行
+    新实现：当前 main.py 中基于 get_async_db 的接口
+
+用法：
+    python benchmark_async_endpoints.py [并发数] [每个客户端请求数]   # 默认 20 50
+依赖 httpx（在进程内通过ASGI直接调用应用）
+"""
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import insert
+
+ROOM_COUNT = 200
+ISSUES_PER_ROOM = 10
+DELIVERY_STATUSES = ["待交付", "已交付"]
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def build_database(models, engine):
+    """写入测试用户、房间和质量问题"""
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "username": "bench_admin", "password": "", "name": "基准管理员", "role": "admin"}
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i + 1, "building_unit": "3单元", "room_number": f"{i + 101}"}
+            for i in range(ROOM_COUNT)
+        ])
+        conn.execute(insert(models.QualityIssue), [
+            {"room_id": room_id, "user_id": 1, "description": f"问题{room_id}-{k}", "issue_type": "质量瑕疵"}
+            for room_id in range(1, ROOM_COUNT + 1)
+            for k in range(ISSUES_PER_ROOM)
+        ])
+
+def register_legacy_routes(app, models, crud, auth, get_db):
+    """按改造前的写法注册对照接口"""
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+
+    @app.put("/legacy/rooms/{room_id}/delivery-status")
+    async def legacy_update_room_delivery_status(room_id: int, delivery_status: str,
+                                                 db: Session = Depends(get_db),
+                                                 current_user=Depends(auth.get_current_user)):
+        room = db.query(models.Room).filter(models.Room.id == room_id).first()
+        room.delivery_status = delivery_status
+        crud.bump_data_version(db, room_id)
+        db.commit()
+        db.refresh(room)
+        return {"message": "交付状态更新成功", "delivery_status": delivery_status}
+
+    @app.get("/legacy/quality-issues/")
+    def legacy_read_quality_issues(room_id: int = None, limit: int = 20,
+                                   db: Session = Depends(get_db),
+                                   current_user=Depends(auth.get_current_user)):
+        issues, _ = crud.get_quality_issues_page(db, limit, room_id=room_id)
+        return [{"id": issue.id, "description": issue.description} for issue in issues]
+
+async def run_workload(app, headers, prefix, concurrency, requests_per_client):
+    latencies = {"write": [], "read": [], "probe": []}
+    errors = {"write": 0, "read": 0, "probe": 0}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def timed(kind, method, url):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers)
+                ok = response.status_code == 200
+            except Exception:
+                # 旧实现在并发写入时可能出现 database is locked，计为失败请求
+                ok = False
+            latencies[kind].append(time.perf_counter() - start)
+            if not ok:
+                errors[kind] += 1
+
+        async def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(requests_per_client):
+                room_id = rng.randint(1, ROOM_COUNT)
+                if rng.random() < 0.5:
+                    status = rng.choice(DELIVERY_STATUSES)
+                    await timed("write", "PUT", f"{prefix}/rooms/{room_id}/delivery-status?delivery_status={status}")
+                else:
+                    await timed("read", "GET", f"{prefix}/quality-issues/?room_id={room_id}&limit=20")
+
+        done = asyncio.Event()
+
+        async def probe():
+            while not done.is_set():
+                await timed("probe", "GET", "/")
+                await asyncio.sleep(0.002)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+    return latencies, errors, elapsed
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    requests_per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    # 数据库路径是相对路径，切换到临时目录避免影响正式数据库
+    workdir = tempfile.mkdtemp(prefix="zwy_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        import models, crud, auth
+        from database import engine, get_db
+        build_database(models, engine)
+        import main as app_module
+        # ASGITransport不会触发启动事件，直接执行启动时的初始化
+        app_module.initialize_database_and_fonts()
+        app = app_module.app
+        register_legacy_routes(app, models, crud, auth, get_db)
+        headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'bench_admin'})}"}
+
+        print(f"并发数 {concurrency}，每个客户端 {requests_per_client} 个请求")
+        print(f"{'实现':<6} {'请求类型':<8} {'数量':>6} {'失败':>6} {'p50(ms)':>9} {'p99(ms)':>9}")
+        for label, prefix in (("旧实现", "/legacy"), ("新实现", "")):
+            latencies, errors, elapsed = asyncio.run(run_workload(app, headers, prefix, concurrency, requests_per_client))
+            for kind, name in (("write", "状态更新"), ("read", "问题列表"), ("probe", "根路径")):
+                values = latencies[kind]
+                print(f"{label:<6} {name:<8} {len(values):>6} {errors[kind]:>6} {percentile(values, 0.5) * 1000:>9.1f} "
+                      f"{percentile(values, 0.99) * 1000:>9.1f}")
+            print(f"{label:<6} 总吞吐 {concurrency * requests_per_client / elapsed:.0f} req/s")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+PDF导出长时间运行测试
+在临时目录中创建测试数据库，连续请求数千次 /rooms/{room_id}/export-pdf，定期记录进程内存（RSS）、
+打开的文件数、系统临时目录中的PDF文件数和 atexit 回调数，检查它们在预热之后是否保持平稳。
+
+用法：
+    python benchmark_pdf_export_soak.py [导出次数] [并发数] [--cache]   # 默认 2000 4，默认关闭PDF缓存以每次都生成PDF
+依赖 httpx（在进程内通过ASGI直接调用应用），内存和文件数统计需要Linux的 /proc
+"""
+import asyncio
+import atexit
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import insert
+
+ROOM_COUNT = 50
+COMMUNICATIONS_PER_ROOM = 10
+# 预热之后允许的内存增长（MB）
+MAX_RSS_GROWTH_MB = 20
+
+def build_database(models, engine):
+    """写入测试用户、房间、沟通记录和质量问题"""
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "username": "soak_admin", "password": "", "name": "测试管理员", "role": "admin"}
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i + 1, "building_unit": "3单元", "room_number": f"{i + 101}"}
+            for i in range(ROOM_COUNT)
+        ])
+        conn.execute(insert(models.Communication), [
+            {"room_id": room_id, "user_id": 1, "content": f"第{k + 1}次回访，客户关注墙面空鼓整改进度",
+             "feedback": "愿意收房"}
+            for room_id in range(1, ROOM_COUNT + 1)
+            for k in range(COMMUNICATIONS_PER_ROOM)
+        ])
+        conn.execute(insert(models.QualityIssue), [
+            {"room_id": room_id, "user_id": 1, "description": f"卫生间瓷砖空鼓{room_id}", "issue_type": "质量瑕疵"}
+            for room_id in range(1, ROOM_COUNT + 1)
+        ])
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def snapshot():
+    return {
+        "rss_mb": rss_mb(),
+        "open_files": len(os.listdir("/proc/self/fd")),
+        "temp_pdfs": len(glob.glob(os.path.join(tempfile.gettempdir(), "*.pdf"))),
+        "atexit_callbacks": atexit._ncallbacks()
+    }
+
+async def run_exports(app, headers, total: int, concurrency: int, on_progress):
+    transport = httpx.ASGITransport(app=app)
+    errors = 0
+    done = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://soak") as client:
+        async def worker(offset):
+            nonlocal errors, done
+            for i in range(offset, total, concurrency):
+                response = await client.get(f"/rooms/{i % ROOM_COUNT + 1}/export-pdf", headers=headers)
+                if (response.status_code != 200 or not response.content.startswith(b"%PDF")
+                        or int(response.headers["content-length"]) != len(response.content)):
+                    errors += 1
+                done += 1
+                on_progress(done)
+
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return errors
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    total = int(args[0]) if len(args) > 0 else 2000
+    concurrency = int(args[1]) if len(args) > 1 else 4
+    use_cache = "--cache" in sys.argv
+    os.environ["PDF_CACHE"] = "1" if use_cache else "0"
+    # 排队上限不小于并发数，避免请求因PDF生成队列已满返回503被计为失败
+    os.environ.setdefault("PDF_RENDER_QUEUE_SIZE", str(concurrency))
+
+    # 数据库、上传目录和缓存目录都是相对路径，切换到临时目录避免影响正式数据
+    workdir = tempfile.mkdtemp(prefix="zwy_soak_")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        import models, auth
+        from database import engine
+        build_database(models, engine)
+        import main as app_module
+        # ASGITransport不会触发启动事件，直接执行启动时的初始化
+        app_module.initialize_database_and_fonts()
+        headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'soak_admin'})}"}
+
+        print(f"导出 {total} 次，并发数 {concurrency}，PDF缓存{'开启' if use_cache else '关闭'}")
+        print(f"{'已导出':>8} {'RSS(MB)':>9} {'打开文件':>8} {'临时PDF':>8} {'atexit回调':>10}")
+        samples = []
+        interval = max(1, total // 10)
+
+        def on_progress(done):
+            if done % interval == 0 or done == total:
+                sample = snapshot()
+                samples.append(sample)
+                print(f"{done:>8} {sample['rss_mb']:>9.1f} {sample['open_files']:>8} "
+                      f"{sample['temp_pdfs']:>8} {sample['atexit_callbacks']:>10}")
+
+        before = snapshot()
+        start = time.perf_counter()
+        errors = asyncio.run(run_exports(app_module.app, headers, total, concurrency, on_progress))
+        elapsed = time.perf_counter() - start
+        print(f"耗时 {elapsed:.1f}s，平均每次 {elapsed / total * 1000:.1f}ms，失败 {errors} 次")
+
+        # 第一个采样点之前为预热阶段（导入模块、注册字体、建立连接池）
+        warm, last = samples[0], samples[-1]
+        problems = []
+        if errors:
+            problems.append(f"{errors} 次导出失败")
+        if last["rss_mb"] - warm["rss_mb"] > MAX_RSS_GROWTH_MB:
+            problems.append(f"预热后内存增长 {last['rss_mb'] - warm['rss_mb']:.1f}MB")
+        if last["open_files"] > warm["open_files"]:
+            problems.append(f"打开的文件数从 {warm['open_files']} 增加到 {last['open_files']}")
+        if last["temp_pdfs"] > before["temp_pdfs"]:
+            problems.append(f"临时目录中残留 {last['temp_pdfs'] - before['temp_pdfs']} 个PDF文件")
+        if last["atexit_callbacks"] > before["atexit_callbacks"]:
+            problems.append(f"新增 {last['atexit_callbacks'] - before['atexit_callbacks']} 个 atexit 回调")
+
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            return 1
+        print("✅ 内存、打开的文件数和临时文件数保持平稳")
+        return 0
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
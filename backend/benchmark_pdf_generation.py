@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+PDF生成基准测试
+对比每次导出都重新查找注册字体、重建样式（原来的做法）与字体只注册一次、样式复用时的单份PDF耗时
+
+用法：
+    python benchmark_pdf_generation.py [生成份数] [每份沟通记录数]   # 默认 50 20
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import pdf_generator
+
+def make_payload(communication_count: int):
+    start = datetime(2024, 3, 1, 9, 30)
+    communications = [
+        {
+            'content': f"第{i + 1}次回访，客户对厨房墙面空鼓问题表示关注，要求交付前完成整改",
+            'communication_time': start + timedelta(days=i),
+            'feedback': "愿意收房" if i % 3 else "需要整改后再收房",
+            'customer_description': "客户比较在意细节，沟通时需要提前准备整改计划",
+            'created_at': start + timedelta(days=i)
+        }
+        for i in range(communication_count)
+    ]
+    quality_issues = [
+        {
+            'description': f"卫生间墙面第{i + 1}处瓷砖空鼓",
+            'status': "待验收",
+            'created_at': (start + timedelta(days=i)).isoformat(),
+            'user_name': "维修工程师"
+        }
+        for i in range(5)
+    ]
+    return {
+        'room_info': {'building_unit': "3单元", 'room_number': "1201", 'expected_delivery_date': "2024-06-30"},
+        'customer_info': {
+            'name': "张先生", 'gender': "男", 'id_card': "110101199001011234", 'phone': "13800000000",
+            'customer_level': "A", 'work_unit': "某某科技有限公司"
+        },
+        'communications': communications,
+        'quality_issues': quality_issues,
+        'assigned_users': {'maintenance_engineer': "李工", 'customer_ambassador': "王大使"},
+        'latest_customer_description': communications[-1]['customer_description'] if communications else ""
+    }
+
+def reset_caches():
+    """清除字体和样式缓存，下一次生成时与原来一样重新查找注册字体、构建样式"""
+    pdf_generator._font_name = None
+    pdf_generator.get_pdf_styles.cache_clear()
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def run(count: int, payload: dict, cached: bool):
+    latencies = []
+    for _ in range(count):
+        if not cached:
+            reset_caches()
+        start = time.perf_counter()
+        pdf_generator.create_room_communication_pdf(**payload)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    communication_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    payload = make_payload(communication_count)
+
+    print(f"生成 {count} 份PDF，每份 {communication_count} 条沟通记录")
+    print(f"使用字体: {pdf_generator.get_font_name()}（候选路径可通过环境变量 PDF_FONT_PATHS 指定）")
+    # 预热，避免首次导入reportlab模块的耗时计入结果
+    pdf_generator.create_room_communication_pdf(**payload)
+
+    results = {}
+    for cached, label in ((False, "每次注册字体、重建样式"), (True, "字体和样式只构建一次")):
+        latencies = run(count, payload, cached)
+        results[cached] = sum(latencies) / len(latencies)
+        print(f"{label}: 平均 {results[cached] * 1000:.1f}ms，p50 {percentile(latencies, 0.5) * 1000:.1f}ms，"
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+
+    print(f"单份PDF平均耗时减少 {(1 - results[True] / results[False]) * 100:.0f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+房间列表查询基准测试
+在内存数据库中构造不同规模的房间和用户分配数据，统计 crud.get_rooms 执行的SQL语句数量和耗时，
+验证语句数量不随房间数量增长
+
+用法：
+    python benchmark_room_queries.py [房间数量 ...]   # 默认 300 3000 30000
+"""
+import sys
+import time
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import models
+import crud
+
+ROLES = ["customer_ambassador", "project_engineer", "maintenance_engineer"]
+
+def build_database(room_count: int):
+    """创建内存数据库：每个房间分配给每种角色的一名用户"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    
+    user_count = max(len(ROLES), room_count // 50)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": i + 1, "username": f"user{i + 1}", "password": "", "name": f"用户{i + 1}", "role": ROLES[i % len(ROLES)]}
+            for i in range(user_count)
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i + 1, "building_unit": "3单元" if i % 2 else "4单元", "room_number": f"{i + 101}"}
+            for i in range(room_count)
+        ])
+        conn.execute(insert(models.UserRoom), [
+            {"user_id": (room_id * len(ROLES) + offset) % user_count + 1, "room_id": room_id}
+            for room_id in range(1, room_count + 1)
+            for offset in range(len(ROLES))
+        ])
+    return engine
+
+def measure(room_count: int):
+    engine = build_database(room_count)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        start = time.perf_counter()
+        rooms = crud.get_rooms(db)
+        elapsed = time.perf_counter() - start
+        assignments = sum(len(room.assigned_users) for room in rooms)
+    finally:
+        db.close()
+        engine.dispose()
+    return len(rooms), assignments, len(statements), elapsed
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [300, 3000, 30000]
+    print(f"{'房间数':>8} {'分配数':>8} {'SQL语句数':>10} {'耗时(ms)':>10}")
+    counts = set()
+    for size in sizes:
+        rooms, assignments, statement_count, elapsed = measure(size)
+        counts.add(statement_count)
+        print(f"{rooms:>8} {assignments:>8} {statement_count:>10} {elapsed * 1000:>10.1f}")
+    
+    if len(counts) == 1:
+        print("✅ SQL语句数量与房间数量无关")
+        return 0
+    print("❌ SQL语句数量随房间数量变化")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
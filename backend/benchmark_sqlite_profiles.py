@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SQLite配置档基准测试
+分别使用 default 和 tuned 配置档在临时数据库文件上运行读写混合负载：
+多个线程同时查询质量问题列表和录入质量问题，统计吞吐量、延迟和失败次数
+
+用法：
+    python benchmark_sqlite_profiles.py [线程数] [持续秒数] [写入比例]   # 默认 8 10 0.3
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+import models
+import crud
+import schemas
+from database import SQLITE_PROFILES, create_database_engine, read_sqlite_pragmas
+
+ROOM_COUNT = 300
+ISSUES_PER_ROOM = 10
+
+def build_database(engine):
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "username": "bench", "password": "", "name": "基准用户", "role": "maintenance_engineer"}
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i + 1, "building_unit": "3单元", "room_number": f"{i + 101}"}
+            for i in range(ROOM_COUNT)
+        ])
+        conn.execute(insert(models.QualityIssue), [
+            {"room_id": room_id, "user_id": 1, "description": f"问题{room_id}-{k}", "issue_type": "质量瑕疵"}
+            for room_id in range(1, ROOM_COUNT + 1)
+            for k in range(ISSUES_PER_ROOM)
+        ])
+    with sessionmaker(bind=engine)() as db:
+        crud.rebuild_room_summaries(db)
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def run_profile(profile: str, threads: int, duration: float, write_ratio: float):
+    workdir = tempfile.mkdtemp(prefix="zwy_sqlite_bench_")
+    engine = create_database_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", profile)
+    try:
+        build_database(engine)
+        with engine.connect() as connection:
+            pragmas = read_sqlite_pragmas(connection)
+        SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        results = {"read": [], "write": []}
+        errors = {"read": 0, "write": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                room_id = rng.randint(1, ROOM_COUNT)
+                kind = "write" if rng.random() < write_ratio else "read"
+                start = time.perf_counter()
+                db = SessionFactory()
+                try:
+                    if kind == "write":
+                        crud.create_quality_issue(db, schemas.QualityIssueCreate(room_id=room_id, description="基准测试"), user_id=1)
+                    else:
+                        crud.get_quality_issues_page(db, 20, room_id=room_id)
+                    ok = True
+                except OperationalError:
+                    db.rollback()
+                    ok = False
+                finally:
+                    db.close()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        results[kind].append(elapsed)
+                    else:
+                        errors[kind] += 1
+
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return pragmas, results, errors
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    write_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+    print(f"线程数 {threads}，每个配置档持续 {duration:.0f} 秒，写入比例 {write_ratio:.0%}")
+
+    for profile in SQLITE_PROFILES:
+        pragmas, results, errors = run_profile(profile, threads, duration, write_ratio)
+        total = len(results["read"]) + len(results["write"])
+        print(f"\n配置档 {profile}: " + ", ".join(f"{name}={value}" for name, value in pragmas.items()))
+        print(f"  总吞吐 {total / duration:.0f} ops/s")
+        for kind, name in (("read", "读取"), ("write", "写入")):
+            values = results[kind]
+            print(f"  {name}: {len(values) / duration:>7.0f} ops/s  p50 {percentile(values, 0.5) * 1000:>7.1f}ms  "
+                  f"p99 {percentile(values, 0.99) * 1000:>7.1f}ms  失败 {errors[kind]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
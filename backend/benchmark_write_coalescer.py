@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+合并写入基准测试
+多个线程同时录入质量问题和沟通记录，对比逐条提交（crud.create_quality_issue / create_communication）
+与通过 WriteCoalescer 合并提交的吞吐量和延迟，并检查房间待验收问题数是否与实际数据一致
+
+用法：
+    python benchmark_write_coalescer.py [线程数] [每个线程写入数] [时间窗口毫秒]   # 默认 32 50 5
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+import models
+import crud
+import schemas
+from database import create_database_engine
+from write_coalescer import WriteCoalescer
+
+ROOM_COUNT = 100
+
+def build_database(path: str):
+    engine = create_database_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "username": "bench", "password": "", "name": "基准用户", "role": "customer_ambassador"}
+        ])
+        conn.execute(insert(models.Room), [
+            {"id": i + 1, "building_unit": "3单元", "room_number": f"{i + 101}"}
+            for i in range(ROOM_COUNT)
+        ])
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionFactory() as db:
+        crud.rebuild_room_summaries(db)
+    return engine, SessionFactory
+
+def make_payload(rng):
+    room_id = rng.randint(1, ROOM_COUNT)
+    if rng.random() < 0.5:
+        return "quality_issue", schemas.QualityIssueCreate(room_id=room_id, description="基准测试问题")
+    return "communication", schemas.CommunicationCreate(room_id=room_id, content="基准测试沟通", feedback="愿意收房")
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def check_consistency(SessionFactory):
+    """房间汇总中的待验收问题数应等于实际待验收问题数，房间状态与之一致"""
+    with SessionFactory() as db:
+        actual = dict(db.query(models.QualityIssue.room_id, func.count()).filter(
+            models.QualityIssue.status == "待验收").group_by(models.QualityIssue.room_id).all())
+        mismatched = [
+            room.id for room in db.query(models.Room)
+            if room.summary.pending_issues_count != actual.get(room.id, 0)
+            or (actual.get(room.id, 0) > 0 and room.status != "整改中")
+        ]
+        total = db.query(models.QualityIssue).count() + db.query(models.Communication).count()
+    return total, mismatched
+
+def run(mode: str, threads: int, per_thread: int, window_ms: float):
+    workdir = tempfile.mkdtemp(prefix="zwy_coalesce_bench_")
+    engine, SessionFactory = build_database(os.path.join(workdir, "bench.db"))
+    coalescer = WriteCoalescer(window_ms=window_ms, session_factory=SessionFactory) if mode == "coalesced" else None
+    single = {"quality_issue": crud.create_quality_issue, "communication": crud.create_communication}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(per_thread):
+            kind, payload = make_payload(rng)
+            start = time.perf_counter()
+            if coalescer:
+                result = coalescer.write(kind, payload, 1)
+            else:
+                with SessionFactory() as db:
+                    result = single[kind](db, payload, 1)
+            assert result.id is not None
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = coalescer.stats() if coalescer else None
+        if coalescer:
+            coalescer.shutdown()
+        total, mismatched = check_consistency(SessionFactory)
+        return elapsed, latencies, stats, total, mismatched
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    window_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"线程数 {threads}，每个线程写入 {per_thread} 条，合并时间窗口 {window_ms}ms")
+
+    ok = True
+    for mode, label in (("single", "逐条提交"), ("coalesced", "合并提交")):
+        elapsed, latencies, stats, total, mismatched = run(mode, threads, per_thread, window_ms)
+        print(f"\n{label}: {total} 条记录，耗时 {elapsed:.2f}s，吞吐 {len(latencies) / elapsed:.0f} 条/s，"
+              f"p50 {percentile(latencies, 0.5) * 1000:.1f}ms，p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+        if stats:
+            print(f"  批次 {stats['batches']}，平均每批 {stats['avg_batch_size']} 条，最大 {stats['max_batch_size']} 条，"
+                  f"逐条重做 {stats['fallbacks']} 次")
+        if mismatched or total != threads * per_thread:
+            ok = False
+            print(f"  ❌ 数据不一致：记录数 {total}，计数错误的房间 {mismatched[:10]}")
+
+    if ok:
+        print("\n✅ 两种方式的房间状态与汇总数据均与实际数据一致")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
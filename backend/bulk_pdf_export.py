@@ -0,0 +1,218 @@
+"""
+按楼栋单元批量导出沟通记录PDF
+
+交房前需要一个单元所有房间的PDF，逐个调用 /rooms/{room_id}/export-pdf 时每个房间都要单独
+查询沟通记录、质量问题和用户分配。批量导出按 BULK_EXPORT_BATCH_SIZE 个房间一批，每批用几次
+查询取出数据，交给PDF生成进程池并行生成，每生成完一份就写入ZIP压缩包并发送给客户端。
+每次导出对应一个导出任务，可通过 /admin/export-jobs/{job_id} 查询进度。
+浏览器下载时先创建导出任务，再用任务ID作为一次性下载凭证直接打开下载地址，文件边接收边写入磁盘。
+"""
+import functools
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import crud
+import pdf_cache
+from database import SessionLocal
+from pdf_render_pool import pdf_render_pool, PDF_RENDER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# 每批查询的房间数
+BULK_EXPORT_BATCH_SIZE = int(os.getenv("BULK_EXPORT_BATCH_SIZE", "50"))
+# 同时生成的PDF数，默认与PDF生成进程数相同
+BULK_EXPORT_CONCURRENCY = int(os.getenv("BULK_EXPORT_CONCURRENCY", str(max(pdf_render_pool.workers, 1))))
+# 保留最近多少个导出任务的进度
+EXPORT_JOBS_KEEP = int(os.getenv("EXPORT_JOBS_KEEP", "50"))
+# 创建导出任务后下载地址的有效时间（秒）
+EXPORT_DOWNLOAD_TTL = int(os.getenv("EXPORT_DOWNLOAD_TTL", "300"))
+
+class ExportJob:
+    """一次批量导出的进度，状态依次为 pending、running，最后为 completed、failed 或 cancelled"""
+
+    def __init__(self, building_unit: str, room_ids):
+        self.id = uuid.uuid4().hex
+        self.building_unit = building_unit
+        self.room_ids = list(room_ids)
+        self.total = len(self.room_ids)
+        self.status = "pending"
+        self.completed = 0
+        self.failures = []
+        self.bytes_sent = 0
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self._created_monotonic = time.monotonic()
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """通过下载地址开始导出，每个任务只能在有效时间内下载一次"""
+        with self._lock:
+            if self.status != "pending" or time.monotonic() - self._created_monotonic > EXPORT_DOWNLOAD_TTL:
+                return False
+            self.status = "running"
+            return True
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+
+    def record_done(self):
+        with self._lock:
+            self.completed += 1
+
+    def record_failure(self, room_id: int, room_number: str, error: str):
+        with self._lock:
+            self.failures.append({"room_id": room_id, "room_number": room_number, "error": error})
+
+    def record_sent(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+
+    def finish(self, status: str):
+        with self._lock:
+            self.status = status
+            self.finished_at = datetime.now()
+
+    def to_dict(self):
+        with self._lock:
+            processed = self.completed + len(self.failures)
+            return {
+                "job_id": self.id,
+                "building_unit": self.building_unit,
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": len(self.failures),
+                "progress": round(processed / self.total, 4) if self.total else 1.0,
+                "bytes_sent": self.bytes_sent,
+                "created_at": self.created_at.isoformat(timespec="seconds"),
+                "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+                "failures": list(self.failures)
+            }
+
+class ExportJobRegistry:
+    """按创建顺序保留最近的导出任务"""
+
+    def __init__(self, keep: int = EXPORT_JOBS_KEEP):
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, building_unit: str, room_ids) -> ExportJob:
+        job = ExportJob(building_unit, room_ids)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """最近的导出任务，最新的在前"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+export_jobs = ExportJobRegistry()
+
+class _ZipOutput:
+    """ZIP压缩包的输出缓冲区，只支持追加写入；zipfile写入不可seek的流时在每个文件数据后写入数据描述符"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _render_room_pdf(room_id: int, pdf_data: dict) -> bytes:
+    """生成单个房间的PDF（数据没有变化时读取缓存），进程池已满时等待空位而不是直接失败"""
+    render = functools.partial(pdf_render_pool.render, wait=PDF_RENDER_TIMEOUT)
+    pdf_file, _ = pdf_cache.open_or_create_pdf(room_id, pdf_data, render)
+    with pdf_file:
+        return pdf_file.read()
+
+def _pdf_filename(room_info: dict) -> str:
+    return f"瑧湾悦二期-{room_info['building_unit']}-{room_info['room_number']}-沟通记录.pdf"
+
+def stream_building_unit_zip(job: ExportJob):
+    """生成ZIP压缩包内容的迭代器，每写入一份PDF返回一段数据
+
+    PDF已经是压缩过的格式，压缩包中直接存储不再压缩；生成失败的房间记录在任务中，
+    并在压缩包末尾附上 导出失败.txt
+    """
+    job.start()
+    room_ids = job.room_ids
+    output = _ZipOutput()
+    executor = ThreadPoolExecutor(max_workers=BULK_EXPORT_CONCURRENCY, thread_name_prefix="bulk-pdf-export")
+    filenames = set()
+    try:
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+            for start in range(0, len(room_ids), BULK_EXPORT_BATCH_SIZE):
+                batch = room_ids[start:start + BULK_EXPORT_BATCH_SIZE]
+                with SessionLocal() as db:
+                    items = crud.get_rooms_pdf_data(db, batch)
+                found = {room_id for room_id, _ in items}
+                for room_id in batch:
+                    if room_id not in found:
+                        job.record_failure(room_id, "", "房间不存在")
+
+                futures = {
+                    executor.submit(_render_room_pdf, room_id, pdf_data): (room_id, pdf_data['room_info'])
+                    for room_id, pdf_data in items
+                }
+                for future in as_completed(futures):
+                    room_id, room_info = futures[future]
+                    try:
+                        pdf_bytes = future.result()
+                    except Exception as e:
+                        logger.warning("批量导出房间 %s 的PDF失败: %s", room_id, e)
+                        job.record_failure(room_id, room_info['room_number'], str(e) or type(e).__name__)
+                        continue
+                    filename = _pdf_filename(room_info)
+                    if filename in filenames:
+                        filename = filename[:-len(".pdf")] + f"-{room_id}.pdf"
+                    filenames.add(filename)
+                    archive.writestr(zipfile.ZipInfo(filename, date_time=datetime.now().timetuple()[:6]), pdf_bytes)
+                    job.record_done()
+                    chunk = output.take()
+                    job.record_sent(len(chunk))
+                    yield chunk
+
+            failures = job.to_dict()["failures"]
+            if failures:
+                lines = [f"房间ID {item['room_id']} {item['room_number']}: {item['error']}" for item in failures]
+                archive.writestr(zipfile.ZipInfo("导出失败.txt", date_time=datetime.now().timetuple()[:6]),
+                                 "\n".join(lines).encode("utf-8"))
+        # 关闭压缩包时写入中央目录
+        chunk = output.take()
+        job.record_sent(len(chunk))
+        yield chunk
+        job.finish("completed")
+    except GeneratorExit:
+        # 客户端中途断开后由调用方关闭迭代器
+        job.finish("cancelled")
+        raise
+    except Exception:
+        logger.exception("批量导出 %s 失败", job.building_unit)
+        job.finish("failed")
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -6,6 +6,7 @@
 from sqlalchemy.orm import sessionmaker
 from database import engine
 import models
+import crud
 
 # 创建数据库会话
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -59,6 +60,9 @@ def clean_test_data():
         
         # 提交更改
         db.commit()
+        
+        # 6. 重建房间汇总数据
+        crud.rebuild_room_summaries(db)
         print("\n数据清理完成！")
         
         # 显示清理后的统计信息
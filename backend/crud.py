@@ -1,11 +1,43 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy.orm import Session, joinedload, contains_eager
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import func, desc, insert, update, and_, or_, type_coerce, String
 import models, schemas, auth
-from typing import List, Optional
+from database import write_transaction
+from typing import List, Optional, Tuple
 import json
+import base64
+from datetime import date, datetime, timedelta
 import random
 import string
 
+# Data versions
+GLOBAL_VERSION_SCOPE = "global"
+
+def _room_version_scope(room_id: int):
+    return f"room:{room_id}"
+
+def bump_data_version(db: Session, *room_ids: int):
+    """在当前事务内递增全局数据版本号及指定房间的版本号
+    
+    不提交事务，由调用方与写操作一并提交
+    """
+    scopes = [GLOBAL_VERSION_SCOPE] + [_room_version_scope(room_id) for room_id in set(room_ids) if room_id is not None]
+    for scope in scopes:
+        db.execute(
+            sqlite_insert(models.DataVersion)
+            .values(scope=scope, version=1)
+            .on_conflict_do_update(
+                index_elements=[models.DataVersion.scope],
+                set_={'version': models.DataVersion.version + 1}
+            )
+        )
+
+def get_data_version(db: Session, room_id: Optional[int] = None):
+    """获取全局或指定房间的数据版本号"""
+    scope = GLOBAL_VERSION_SCOPE if room_id is None else _room_version_scope(room_id)
+    version = db.query(models.DataVersion.version).filter(models.DataVersion.scope == scope).scalar()
+    return version or 0
+
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
@@ -19,6 +51,7 @@ def generate_initial_password():
     """生成6位数字初始密码"""
     return ''.join(random.choices(string.digits, k=6))
 
+@write_transaction
 def create_user(db: Session, user: schemas.UserCreate):
     # 生成初始密码（如果没有提供）
     initial_password = user.password if hasattr(user, 'password') else generate_initial_password()
@@ -33,33 +66,43 @@ def create_user(db: Session, user: schemas.UserCreate):
         password_changed=False
     )
     db.add(db_user)
+    bump_data_version(db)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+@write_transaction
 def reset_user_password(db: Session, user_id: int):
     """重置用户密码为新的初始密码"""
+    # 生成新的初始密码，先完成哈希计算再开始事务，避免持有写锁期间进行bcrypt计算
+    new_initial_password = generate_initial_password()
+    hashed_password = auth.get_password_hash(new_initial_password)
+    
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         return None
     
-    # 生成新的初始密码
-    new_initial_password = generate_initial_password()
-    hashed_password = auth.get_password_hash(new_initial_password)
-    
     user.password = hashed_password
     user.initial_password = new_initial_password
     user.password_changed = False
+    bump_data_version(db)
     db.commit()
     db.refresh(user)
+    auth.invalidate_cached_user(user.username)
     return user
 
+@write_transaction
 def delete_user(db: Session, user_id: int):
     """删除用户及其相关数据"""
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         return False
     
+    # 记录受影响的房间，删除后需要刷新汇总数据
+    affected_room_ids = {room_id for (room_id,) in db.query(models.QualityIssue.room_id).filter(models.QualityIssue.user_id == user_id).distinct()}
+    affected_room_ids |= {room_id for (room_id,) in db.query(models.Communication.room_id).filter(models.Communication.user_id == user_id).distinct()}
+    assigned_room_ids = {room_id for (room_id,) in db.query(models.UserRoom.room_id).filter(models.UserRoom.user_id == user_id)}
+    
     # 删除用户的房间分配
     db.query(models.UserRoom).filter(models.UserRoom.user_id == user_id).delete()
     
@@ -69,26 +112,37 @@ def delete_user(db: Session, user_id: int):
     # 删除用户的沟通记录
     db.query(models.Communication).filter(models.Communication.user_id == user_id).delete()
     
+    # 刷新受影响房间的汇总数据
+    for room_id in affected_room_ids:
+        refresh_room_summary(db, room_id)
+    bump_data_version(db, *(affected_room_ids | assigned_room_ids))
+    
     # 删除用户
+    username = user.username
     db.delete(user)
     db.commit()
+    auth.invalidate_cached_user(username)
     return True
 
 # Room operations
 def get_rooms(db: Session):
-    rooms = db.query(models.Room).all()
+    rooms = db.query(models.Room).order_by(models.Room.id).all()
+    
+    # 一次查询取出所有用户分配及对应的用户信息，避免逐个房间查询
+    assigned_users = {}
+    assignments = db.query(
+        models.UserRoom.room_id, models.User.id, models.User.name, models.User.role
+    ).join(models.User, models.User.id == models.UserRoom.user_id).order_by(models.UserRoom.id)
+    for room_id, user_id, name, role in assignments:
+        assigned_users.setdefault(room_id, []).append({
+            'id': user_id,
+            'name': name,
+            'role': role
+        })
+    
     # 为每个房间添加用户分配信息
     for room in rooms:
-        assignments = db.query(models.UserRoom).filter(models.UserRoom.room_id == room.id).all()
-        room.assigned_users = []
-        for assignment in assignments:
-            user = db.query(models.User).filter(models.User.id == assignment.user_id).first()
-            if user:
-                room.assigned_users.append({
-                    'id': user.id,
-                    'name': user.name,
-                    'role': user.role
-                })
+        room.assigned_users = assigned_users.get(room.id, [])
     return rooms
 
 def get_user_rooms(db: Session, user_id: int):
@@ -107,13 +161,18 @@ def get_room_by_id(db: Session, room_id: int, user_id: Optional[int] = None):
         return None
     return room
 
+@write_transaction
 def create_room(db: Session, room: schemas.RoomCreate):
     db_room = models.Room(**room.dict())
     db.add(db_room)
+    db.flush()
+    db.add(models.RoomSummary(room_id=db_room.id, **_summary_fields()))
+    bump_data_version(db, db_room.id)
     db.commit()
     db.refresh(db_room)
     return db_room
 
+@write_transaction
 def delete_room(db: Session, room_id: int):
     """删除房间及其相关数据"""
     room = db.query(models.Room).filter(models.Room.id == room_id).first()
@@ -129,25 +188,36 @@ def delete_room(db: Session, room_id: int):
     # 删除房间的沟通记录
     db.query(models.Communication).filter(models.Communication.room_id == room_id).delete()
     
+    # 删除房间的汇总数据
+    db.query(models.RoomSummary).filter(models.RoomSummary.room_id == room_id).delete()
+    bump_data_version(db, room_id)
+    
     # 删除房间
     db.delete(room)
     db.commit()
     return True
 
+@write_transaction
+@write_transaction
 def assign_room_to_user(db: Session, user_id: int, room_id: int):
-    # 检查是否已分配
-    existing = db.query(models.UserRoom).filter(
+    """分配房间给用户，已分配时返回已有的分配
+    
+    依靠(user_id, room_id)唯一索引去重，同时分配同一房间时不会插入重复记录，也不会因唯一约束报错
+    """
+    inserted = db.execute(
+        sqlite_insert(models.UserRoom)
+        .values(user_id=user_id, room_id=room_id)
+        .on_conflict_do_nothing(index_elements=[models.UserRoom.user_id, models.UserRoom.room_id])
+    ).rowcount
+    if inserted:
+        bump_data_version(db, room_id)
+    # 已分配时也提交（空事务），避免回滚后返回的记录过期
+    db.commit()
+    
+    return db.query(models.UserRoom).filter(
         models.UserRoom.user_id == user_id,
         models.UserRoom.room_id == room_id
     ).first()
-    if existing:
-        return existing
-    
-    assignment = models.UserRoom(user_id=user_id, room_id=room_id)
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
-    return assignment
 
 def get_room_assignments(db: Session):
     return db.query(models.UserRoom).all()
@@ -165,20 +235,25 @@ def get_user_room_assignments(db: Session, user_id: int):
         })
     return result
 
+@write_transaction
 def delete_room_assignment(db: Session, assignment_id: int):
     assignment = db.query(models.UserRoom).filter(models.UserRoom.id == assignment_id).first()
     if assignment:
         db.delete(assignment)
+        bump_data_version(db, assignment.room_id)
         db.commit()
         return True
     return False
 
 # Quality Issue operations
-def get_quality_issues(db: Session, room_id: Optional[int] = None, user_id: Optional[int] = None):
-    # 先构建基础查询，包含user的JOIN
-    from sqlalchemy.orm import joinedload
+def get_quality_issues(db: Session, room_id: Optional[int] = None, user_id: Optional[int] = None,
+                       status: Optional[str] = None, issue_type: Optional[str] = None,
+                       date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       cursor: Optional[str] = None, limit: Optional[int] = None):
+    # 先构建基础查询，录入人和验收人在同一查询中加载
     query = db.query(models.QualityIssue).options(
-        joinedload(models.QualityIssue.user)
+        joinedload(models.QualityIssue.user),
+        joinedload(models.QualityIssue.acceptor)
     )
     
     if room_id:
@@ -186,6 +261,25 @@ def get_quality_issues(db: Session, room_id: Optional[int] = None, user_id: Opti
     if user_id:
         # 只显示用户有权限的房间的质量问题
         query = query.join(models.UserRoom, models.QualityIssue.room_id == models.UserRoom.room_id).filter(models.UserRoom.user_id == user_id)
+    if status:
+        query = query.filter(models.QualityIssue.status == status)
+    if issue_type:
+        query = query.filter(models.QualityIssue.issue_type == issue_type)
+    
+    # 按录入时间筛选（未指定录入时间的按创建时间），date_to 包含当天
+    record_time = func.coalesce(models.QualityIssue.record_date, models.QualityIssue.created_at)
+    if date_from:
+        query = query.filter(record_time >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(record_time < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    
+    # 按ID游标分页
+    order_keys = [(models.QualityIssue.id, False)]
+    if cursor:
+        query = query.filter(_keyset_after(order_keys, decode_cursor(cursor)))
+    query = query.order_by(models.QualityIssue.id)
+    if limit is not None:
+        query = query.limit(limit)
     
     issues = query.all()
     # 为每个质量问题添加用户信息和计算is_verified字段
@@ -195,37 +289,121 @@ def get_quality_issues(db: Session, room_id: Optional[int] = None, user_id: Opti
         # 设置is_verified字段（保证前端工作台兼容性）
         issue.is_verified = issue.status == "已验收"
         # 添加验收人信息
-        if issue.accepted_by:
-            acceptor = db.query(models.User).filter(models.User.id == issue.accepted_by).first()
-            if acceptor:
-                issue.acceptor_name = acceptor.name
-                issue.acceptor_role = acceptor.role
+        if issue.acceptor:
+            issue.acceptor_name = issue.acceptor.name
+            issue.acceptor_role = issue.acceptor.role
     return issues
 
+def get_quality_issues_page(db: Session, limit: int, **filters):
+    """获取一页质量问题，返回 (质量问题列表, 下一页游标)"""
+    issues = get_quality_issues(db, limit=limit + 1, **filters)
+    next_cursor = None
+    if len(issues) > limit:
+        issues = issues[:limit]
+        next_cursor = encode_cursor([issues[-1].id])
+    return issues, next_cursor
+
+@write_transaction
 def create_quality_issue(db: Session, issue: schemas.QualityIssueCreate, user_id: int):
     db_issue = models.QualityIssue(**issue.dict(), user_id=user_id)
     db.add(db_issue)
-    db.commit()
-    db.refresh(db_issue)
     
-    # 更新房间状态为"整改中"
+    # 刷新汇总数据中的待验收问题数，房间状态更新为"整改中"
+    refresh_room_summary(db, issue.room_id)
     update_room_status(db, issue.room_id)
+    db.commit()
+    db.refresh(db_issue)
     return db_issue
 
+@write_transaction
+def create_quality_issues(db: Session, items: List[Tuple[schemas.QualityIssueCreate, int]]):
+    """批量录入质量问题，items为 (问题, 录入人ID) 列表
+    
+    一条INSERT ... RETURNING写入全部问题，每个房间只更新一次计数和汇总，整体一次提交；
+    返回与items顺序一致的问题对象。调用方应使用 expire_on_commit=False 的Session，
+    以便提交后直接读取返回对象
+    """
+    if not items:
+        return []
+    issues = db.scalars(
+        insert(models.QualityIssue).returning(models.QualityIssue, sort_by_parameter_order=True),
+        [dict(issue.dict(), user_id=user_id) for issue, user_id in items]
+    ).all()
+    
+    # 每个房间只刷新一次汇总数据和状态
+    room_ids = {issue.room_id for issue, _ in items}
+    refresh_room_summaries(db, room_ids)
+    update_room_status(db, *room_ids)
+    db.commit()
+    return issues
+
+@write_transaction
 def accept_quality_issue(db: Session, issue_id: int, user_id: int):
-    from datetime import datetime
     issue = db.query(models.QualityIssue).filter(models.QualityIssue.id == issue_id).first()
     if issue:
         issue.status = "已验收"
         issue.accepted_by = user_id
         issue.accepted_at = datetime.now()
-        db.commit()
         
-        # 检查房间是否可以设置为"闭户"
+        # 刷新待验收问题数，检查房间是否可以设置为"验收完成"
+        refresh_room_summary(db, issue.room_id)
         update_room_status(db, issue.room_id)
+        db.commit()
         return issue
     return None
 
+@write_transaction
+def accept_quality_issues(db: Session, issue_ids: List[int], user_id: int, permission_user_id: Optional[int] = None):
+    """批量验收质量问题
+    
+    用一条UPDATE验收所有可验收的问题，每个受影响的房间只更新一次状态，整体一次提交。
+    指定permission_user_id时只能验收分配给该用户的房间的问题。
+    返回 {问题ID: 结果}，结果为 accepted / already_accepted / not_found / forbidden
+    """
+    issue_ids = list(dict.fromkeys(issue_ids))
+    results = {issue_id: "not_found" for issue_id in issue_ids}
+    if not issue_ids:
+        return results
+    
+    found = db.query(models.QualityIssue.id, models.QualityIssue.room_id).filter(
+        models.QualityIssue.id.in_(issue_ids)
+    ).all()
+    permitted_room_ids = None
+    if permission_user_id is not None:
+        permitted_room_ids = {room_id for (room_id,) in db.query(models.UserRoom.room_id).filter(
+            models.UserRoom.user_id == permission_user_id,
+            models.UserRoom.room_id.in_({room_id for _, room_id in found})
+        )}
+    
+    acceptable_ids = []
+    for issue_id, room_id in found:
+        if permitted_room_ids is not None and room_id not in permitted_room_ids:
+            results[issue_id] = "forbidden"
+        else:
+            results[issue_id] = "already_accepted"
+            acceptable_ids.append(issue_id)
+    if not acceptable_ids:
+        return results
+    
+    accepted = db.execute(
+        update(models.QualityIssue)
+        .where(models.QualityIssue.id.in_(acceptable_ids), models.QualityIssue.status == "待验收")
+        .values(status="已验收", accepted_by=user_id, accepted_at=datetime.now())
+        .returning(models.QualityIssue.id, models.QualityIssue.room_id)
+    ).all()
+    
+    # 每个受影响的房间只刷新一次汇总数据和状态
+    accepted_room_ids = set()
+    for issue_id, room_id in accepted:
+        results[issue_id] = "accepted"
+        accepted_room_ids.add(room_id)
+    refresh_room_summaries(db, accepted_room_ids)
+    update_room_status(db, *accepted_room_ids)
+    
+    db.commit()
+    return results
+
+@write_transaction
 def update_quality_issue(db: Session, issue_id: int, issue_update: schemas.QualityIssueUpdate, user_id: Optional[int] = None):
     """更新质量问题"""
     query = db.query(models.QualityIssue).filter(models.QualityIssue.id == issue_id)
@@ -239,11 +417,12 @@ def update_quality_issue(db: Session, issue_id: int, issue_update: schemas.Quali
         for key, value in issue_update.dict(exclude_unset=True).items():
             if value is not None:
                 setattr(issue, key, value)
-        db.commit()
-        db.refresh(issue)
         
-        # 更新房间状态
+        # 更新汇总数据和房间状态
+        refresh_room_summary(db, issue.room_id)
         update_room_status(db, issue.room_id)
+        db.commit()
+        db.refresh(issue)
         
         # 设置is_verified字段（保证前端兼容性）
         issue.is_verified = issue.status == "已验收"
@@ -252,32 +431,87 @@ def update_quality_issue(db: Session, issue_id: int, issue_update: schemas.Quali
     return None
 
 # Communication operations
-def get_communications(db: Session, room_id: Optional[int] = None, user_id: Optional[int] = None):
-    query = db.query(models.Communication).join(models.User, models.Communication.user_id == models.User.id)
+def _communication_order_keys():
+    """沟通记录排序键：沟通时间降序（为空时使用创建时间），与表达式索引一致
+    
+    时间按数据库中的原始文本比较，保证游标取值与存储值完全一致
+    """
+    effective_time = type_coerce(
+        func.coalesce(models.Communication.communication_time, models.Communication.created_at), String
+    )
+    return [(effective_time, True), (models.Communication.id, True)]
+
+def _query_communications(db: Session, room_id: Optional[int] = None, user_id: Optional[int] = None,
+                          cursor: Optional[str] = None, limit: Optional[int] = None):
+    """查询沟通记录，返回 (沟通记录, *排序键取值) 的列表"""
+    order_keys = _communication_order_keys()
+    query = db.query(models.Communication, *[expr for expr, _ in order_keys]).join(
+        models.User, models.Communication.user_id == models.User.id
+    ).options(contains_eager(models.Communication.user))
     if room_id:
         query = query.filter(models.Communication.room_id == room_id)
     if user_id:
         # 只显示用户有权限的房间的沟通记录
         query = query.join(models.UserRoom, models.Communication.room_id == models.UserRoom.room_id).filter(models.UserRoom.user_id == user_id)
+    if cursor:
+        query = query.filter(_keyset_after(order_keys, decode_cursor(cursor)))
     
     # 按沟通时间降序排序，如果沟通时间为空则按创建时间降序排序
-    query = query.order_by(desc(func.coalesce(models.Communication.communication_time, models.Communication.created_at)))
+    query = query.order_by(*[desc(expr) if descending else expr for expr, descending in order_keys])
+    if limit is not None:
+        query = query.limit(limit)
     
-    communications = query.all()
+    rows = query.all()
     # 为每个沟通记录添加用户信息
-    for comm in communications:
+    for comm, *_ in rows:
         comm.user_name = comm.user.name
         comm.user_role = comm.user.role
     
-    return communications
+    return rows
+
+def get_communications(db: Session, room_id: Optional[int] = None, user_id: Optional[int] = None,
+                       cursor: Optional[str] = None, limit: Optional[int] = None):
+    return [row[0] for row in _query_communications(db, room_id, user_id, cursor, limit)]
 
+def get_communications_page(db: Session, limit: int, **filters):
+    """获取一页沟通记录，返回 (沟通记录列表, 下一页游标)"""
+    rows = _query_communications(db, limit=limit + 1, **filters)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][1:]))
+    return [row[0] for row in rows], next_cursor
+
+@write_transaction
 def create_communication(db: Session, communication: schemas.CommunicationCreate, user_id: int):
     db_comm = models.Communication(**communication.dict(), user_id=user_id)
     db.add(db_comm)
+    refresh_room_summary(db, communication.room_id)
+    bump_data_version(db, communication.room_id)
     db.commit()
     db.refresh(db_comm)
     return db_comm
 
+@write_transaction
+def create_communications(db: Session, items: List[Tuple[schemas.CommunicationCreate, int]]):
+    """批量添加沟通记录，items为 (沟通记录, 录入人ID) 列表，整体一次提交
+    
+    返回与items顺序一致的沟通记录对象，调用方应使用 expire_on_commit=False 的Session
+    """
+    if not items:
+        return []
+    communications = db.scalars(
+        insert(models.Communication).returning(models.Communication, sort_by_parameter_order=True),
+        [dict(communication.dict(), user_id=user_id) for communication, user_id in items]
+    ).all()
+    
+    room_ids = {communication.room_id for communication, _ in items}
+    refresh_room_summaries(db, room_ids)
+    bump_data_version(db, *room_ids)
+    db.commit()
+    return communications
+
+@write_transaction
 def update_communication(db: Session, communication_id: int, is_implemented: bool, user_id: Optional[int] = None):
     """更新沟通记录的落实状态"""
     query = db.query(models.Communication).filter(models.Communication.id == communication_id)
@@ -289,75 +523,300 @@ def update_communication(db: Session, communication_id: int, is_implemented: boo
     communication = query.first()
     if communication:
         communication.is_implemented = is_implemented
+        refresh_room_summary(db, communication.room_id)
+        bump_data_version(db, communication.room_id)
         db.commit()
         db.refresh(communication)
         return communication
     return None
 
 # Room status management
-def update_room_status(db: Session, room_id: int):
-    # 检查是否有未验收的质量问题
-    pending_issues = db.query(models.QualityIssue).filter(
-        models.QualityIssue.room_id == room_id,
-        models.QualityIssue.status == "待验收"
-    ).count()
+@write_transaction
+def update_room_fields(db: Session, room_id: int, **fields):
+    """更新房间的交付、签约、信件、前期渗漏状态或预计交付时间，房间不存在时返回None"""
+    room = db.get(models.Room, room_id)
+    if not room:
+        return None
+    for key, value in fields.items():
+        setattr(room, key, value)
+    bump_data_version(db, room_id)
+    db.commit()
+    return room
+
+def update_room_status(db: Session, *room_ids: int):
+    """根据room_summary中的待验收问题数更新房间状态
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if room:
-        if pending_issues > 0:
-            room.status = "整改中"
-        else:
-            room.status = "验收完成"
-        db.commit()
+    rooms表上不单独维护待验收问题数：refresh_room_summary(ies) 写入质量问题后本来就要按房间
+    重新统计汇总数据，这里直接读取同一事务中刚刷新的汇总数据（会话中已有，不再查询），
+    按结果分组批量更新房间状态。调用前需先刷新汇总数据；
+    不提交事务，由调用方与触发更新的写操作一并提交
+    """
+    if not room_ids:
+        return
+    room_ids_by_status = {"整改中": [], "验收完成": []}
+    for room_id in set(room_ids):
+        summary = db.get(models.RoomSummary, room_id)
+        status = "整改中" if summary and summary.pending_issues_count > 0 else "验收完成"
+        room_ids_by_status[status].append(room_id)
+    for status, ids in room_ids_by_status.items():
+        if ids:
+            db.query(models.Room).filter(models.Room.id.in_(ids)).update(
+                {models.Room.status: status}, synchronize_session=False
+            )
+    bump_data_version(db, *room_ids)
+
+# Room summary maintenance
+def _latest_per_room(db: Session, model, order_key, *criteria, room_ids=None):
+    """按房间分组取最新的一条记录，同时返回每个房间匹配的记录数
+
+    使用窗口函数一次查询完成，返回 {room_id: (记录, 数量)}
+    """
+    if room_ids is not None:
+        criteria = criteria + (model.room_id.in_(room_ids),)
+    ranked = db.query(
+        model.id.label('id'),
+        func.row_number().over(
+            partition_by=model.room_id,
+            order_by=(desc(order_key), model.id)
+        ).label('rn'),
+        func.count().over(partition_by=model.room_id).label('cnt')
+    ).filter(*criteria).subquery()
+
+    rows = db.query(model, ranked.c.cnt).join(ranked, model.id == ranked.c.id).filter(ranked.c.rn == 1).all()
+    return {record.room_id: (record, count) for record, count in rows}
+
+def _summary_fields(latest_pending_issue=None, pending_issues_count=0,
+                    latest_pending_comm=None, pending_communications_count=0,
+                    latest_comm_with_feedback=None):
+    """根据最新记录构建房间汇总字段"""
+    return {
+        # 聚合的质量问题信息
+        'pending_issues_count': pending_issues_count,
+        'latest_issue_description': latest_pending_issue.description if latest_pending_issue else "",
+        'latest_issue_type': latest_pending_issue.issue_type if latest_pending_issue else "",
+        'latest_issue_record_date': latest_pending_issue.record_date if latest_pending_issue else None,
+        
+        # 聚合的沟通记录信息
+        'pending_communications_count': pending_communications_count,
+        'latest_comm_content': latest_pending_comm.content if latest_pending_comm else "",
+        'latest_comm_time': latest_pending_comm.communication_time if latest_pending_comm else None,
+        
+        # 最新反馈
+        'latest_feedback': latest_comm_with_feedback.feedback if latest_comm_with_feedback else ""
+    }
+
+def _compute_room_summaries(db: Session, room_ids=None):
+    """从质量问题和沟通记录计算房间汇总数据，返回 {room_id: 汇总字段}
+
+    只包含有相关记录的房间，其余房间使用 _summary_fields() 的默认值
+    """
+    comm_time = func.coalesce(models.Communication.communication_time, models.Communication.created_at)
+    
+    # 每个房间的待验收问题数量及最新一条待验收问题
+    pending_issues_by_room = _latest_per_room(
+        db, models.QualityIssue,
+        func.coalesce(models.QualityIssue.record_date, models.QualityIssue.created_at),
+        models.QualityIssue.status == "待验收", room_ids=room_ids
+    )
+    
+    # 每个房间的待落实沟通记录数量及最新一条待落实沟通记录
+    pending_comms_by_room = _latest_per_room(
+        db, models.Communication, comm_time,
+        models.Communication.is_implemented == False, room_ids=room_ids
+    )
+    
+    # 每个房间最新的收房意愿（所有沟通记录中最新的有feedback的记录）
+    feedback_by_room = _latest_per_room(
+        db, models.Communication, comm_time,
+        models.Communication.feedback.isnot(None), room_ids=room_ids
+    )
+    
+    summaries = {}
+    for room_id in set(pending_issues_by_room) | set(pending_comms_by_room) | set(feedback_by_room):
+        summaries[room_id] = _summary_fields(
+            *pending_issues_by_room.get(room_id, (None, 0)),
+            *pending_comms_by_room.get(room_id, (None, 0)),
+            feedback_by_room.get(room_id, (None, 0))[0]
+        )
+    return summaries
+
+def refresh_room_summary(db: Session, room_id: int):
+    """重新计算单个房间的汇总数据
+    
+    不提交事务，由调用方与触发更新的写操作一并提交
+    """
+    refresh_room_summaries(db, [room_id])
+
+def refresh_room_summaries(db: Session, room_ids):
+    """一次查询重新计算多个房间的汇总数据，不提交事务"""
+    room_ids = sorted(set(room_ids))
+    if not room_ids:
+        return
+    db.flush()
+    summaries = _compute_room_summaries(db, room_ids=room_ids)
+    for room_id in room_ids:
+        db.merge(models.RoomSummary(room_id=room_id, **(summaries.get(room_id) or _summary_fields())))
+
+def _rebuild_room_summaries(db: Session):
+    """重新计算所有房间的汇总数据（不提交事务），返回房间数量"""
+    db.flush()
+    summaries = _compute_room_summaries(db)
+    room_ids = [room_id for (room_id,) in db.query(models.Room.id).all()]
+    
+    db.query(models.RoomSummary).delete()
+    if room_ids:
+        db.execute(insert(models.RoomSummary), [
+            {'room_id': room_id, **(summaries.get(room_id) or _summary_fields())}
+            for room_id in room_ids
+        ])
+    return len(room_ids)
+
+@write_transaction
+def rebuild_room_summaries(db: Session):
+    """从头重建room_summary表"""
+    count = _rebuild_room_summaries(db)
+    bump_data_version(db)
+    db.commit()
+    return count
+
+def ensure_room_summaries(db: Session):
+    """如果有房间缺少汇总数据（如旧数据库首次启动），则重建room_summary表"""
+    missing = db.query(models.Room.id).outerjoin(
+        models.RoomSummary, models.RoomSummary.room_id == models.Room.id
+    ).filter(models.RoomSummary.room_id.is_(None)).first()
+    if missing:
+        return rebuild_room_summaries(db)
+    return 0
+
+# Keyset pagination helpers
+def encode_cursor(values):
+    """将排序键的取值编码为不透明的分页游标"""
+    return base64.urlsafe_b64encode(json.dumps(values, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str):
+    """解析分页游标，格式不正确时抛出ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("无效的分页游标")
+    # 游标中的值会直接作为查询参数，只接受能绑定到SQL的标量
+    if not isinstance(values, list) or not all(
+        value is None or isinstance(value, (str, int, float)) for value in values
+    ):
+        raise ValueError("无效的分页游标")
+    return values
+
+def _keyset_after(order_keys, values):
+    """构建键集分页条件：排在游标记录之后的所有行
+
+    order_keys 为 [(表达式, 是否降序), ...]，values 为游标记录对应的取值
+    """
+    if len(values) != len(order_keys):
+        raise ValueError("无效的分页游标")
+    clauses = []
+    for i, ((expr, descending), value) in enumerate(zip(order_keys, values)):
+        prefix = [key == prev for (key, _), prev in zip(order_keys[:i], values[:i])]
+        clauses.append(and_(*prefix, expr < value if descending else expr > value))
+    return or_(*clauses)
 
 # Admin summary
-def get_room_summary(db: Session, building_unit: Optional[str] = None):
-    query = db.query(models.Room)
+SUMMARY_SORT_KEYS = ["id", "room", "pending_issues", "pending_communications"]
+
+def _summary_order_keys(sort: str):
+    pending_issues = func.coalesce(models.RoomSummary.pending_issues_count, 0)
+    pending_communications = func.coalesce(models.RoomSummary.pending_communications_count, 0)
+    order_keys = {
+        "id": [(models.Room.id, False)],
+        "room": [(models.Room.building_unit, False), (models.Room.room_number, False), (models.Room.id, False)],
+        "pending_issues": [(pending_issues, True), (models.Room.id, False)],
+        "pending_communications": [(pending_communications, True), (models.Room.id, False)],
+    }
+    if sort not in order_keys:
+        raise ValueError(f"不支持的排序方式: {sort}")
+    return order_keys[sort]
+
+def _count_rooms_by(db: Session, column, criteria):
+    """按指定字段分组统计房间数量"""
+    query = db.query(column, func.count(models.Room.id)).outerjoin(
+        models.RoomSummary, models.RoomSummary.room_id == models.Room.id
+    ).filter(*criteria).group_by(column)
+    return {value: count for value, count in query.all()}
+
+def get_room_summary(db: Session, building_unit: Optional[str] = None,
+                     status: Optional[str] = None, delivery_status: Optional[str] = None,
+                     contract_status: Optional[str] = None, letter_status: Optional[str] = None,
+                     pre_leakage: Optional[str] = None, has_pending_issues: Optional[bool] = None,
+                     has_pending_communications: Optional[bool] = None, room_number: Optional[str] = None,
+                     sort: str = "id", cursor: Optional[str] = None, limit: Optional[int] = None):
+    """管理员汇总数据
+    
+    status_summary/delivery_summary/contract_summary 统计楼栋范围内的全部房间，
+    filtered_summary 统计满足筛选条件的房间；指定limit时rooms只返回一页，
+    next_cursor 用于获取下一页
+    """
+    order_keys = _summary_order_keys(sort)
+    
+    # 楼栋范围
+    scope = []
     if building_unit:
-        query = query.filter(models.Room.building_unit == building_unit)
+        scope.append(models.Room.building_unit == building_unit)
     
-    rooms = query.all()
+    # 筛选条件
+    criteria = list(scope)
+    if status:
+        criteria.append(models.Room.status == status)
+    if delivery_status:
+        criteria.append(models.Room.delivery_status == delivery_status)
+    if contract_status:
+        criteria.append(models.Room.contract_status == contract_status)
+    if letter_status:
+        criteria.append(func.coalesce(models.Room.letter_status, "无") == letter_status)
+    if pre_leakage:
+        criteria.append(func.coalesce(models.Room.pre_leakage, "无") == pre_leakage)
+    if has_pending_issues is not None:
+        pending_issues = func.coalesce(models.RoomSummary.pending_issues_count, 0)
+        criteria.append(pending_issues > 0 if has_pending_issues else pending_issues == 0)
+    if has_pending_communications is not None:
+        pending_communications = func.coalesce(models.RoomSummary.pending_communications_count, 0)
+        criteria.append(pending_communications > 0 if has_pending_communications else pending_communications == 0)
+    if room_number:
+        criteria.append(models.Room.room_number.contains(room_number.strip(), autoescape=True))
     
     # 统计各状态房间数量
-    status_count = {}
-    delivery_count = {}
-    contract_count = {}
+    status_count = _count_rooms_by(db, models.Room.status, scope)
+    delivery_count = _count_rooms_by(db, models.Room.delivery_status, scope)
+    contract_count = _count_rooms_by(db, models.Room.contract_status, scope)
+    
+    # 统计筛选结果，无额外筛选条件时与楼栋统计相同
+    if len(criteria) > len(scope):
+        filtered_status_count = _count_rooms_by(db, models.Room.status, criteria)
+        filtered_delivery_count = _count_rooms_by(db, models.Room.delivery_status, criteria)
+        filtered_contract_count = _count_rooms_by(db, models.Room.contract_status, criteria)
+    else:
+        filtered_status_count, filtered_delivery_count, filtered_contract_count = status_count, delivery_count, contract_count
+    
+    query = db.query(
+        models.Room, models.RoomSummary, *[expr for expr, _ in order_keys]
+    ).outerjoin(
+        models.RoomSummary, models.RoomSummary.room_id == models.Room.id
+    ).filter(*criteria)
+    if cursor:
+        query = query.filter(_keyset_after(order_keys, decode_cursor(cursor)))
+    query = query.order_by(*[desc(expr) if descending else expr for expr, descending in order_keys])
+    if limit is not None:
+        query = query.limit(limit + 1)
+    
+    rows = query.all()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][2:]))
     
     # 构建带聚合数据的房间列表
     rooms_with_summary = []
     
-    for room in rooms:
-        # 统计房间主状态
-        status_count[room.status] = status_count.get(room.status, 0) + 1
-        # 统计交付状态
-        delivery_count[room.delivery_status] = delivery_count.get(room.delivery_status, 0) + 1
-        # 统计签约状态  
-        contract_count[room.contract_status] = contract_count.get(room.contract_status, 0) + 1
-        
-        # 获取质量问题统计和详情
-        pending_issues = db.query(models.QualityIssue).filter(
-            models.QualityIssue.room_id == room.id,
-            models.QualityIssue.status == "待验收"
-        ).order_by(desc(func.coalesce(models.QualityIssue.record_date, models.QualityIssue.created_at))).all()
-        
-        # 获取最新的待验收问题详情
-        latest_pending_issue = pending_issues[0] if pending_issues else None
-        
-        # 获取沟通记录统计和详情
-        pending_communications = db.query(models.Communication).filter(
-            models.Communication.room_id == room.id,
-            models.Communication.is_implemented == False
-        ).order_by(desc(func.coalesce(models.Communication.communication_time, models.Communication.created_at))).all()
-        
-        # 获取最新的待落实沟通记录详情
-        latest_pending_comm = pending_communications[0] if pending_communications else None
-        
-        # 获取最新的收房意愿（从所有沟通记录中获取最新的有feedback的记录）
-        latest_comm_with_feedback = db.query(models.Communication).filter(
-            models.Communication.room_id == room.id,
-            models.Communication.feedback.isnot(None)
-        ).order_by(desc(func.coalesce(models.Communication.communication_time, models.Communication.created_at))).first()
-        
+    for room, summary, *_ in rows:
         # 构建带聚合数据的房间对象
         room_summary = {
             # 基本房间信息
@@ -372,32 +831,41 @@ def get_room_summary(db: Session, building_unit: Optional[str] = None):
             'expected_delivery_date': room.expected_delivery_date,  # 添加预计交付时间
             'created_at': room.created_at,
             'updated_at': room.updated_at,
-            
-            # 聚合的质量问题信息
-            'pending_issues_count': len(pending_issues),
-            'latest_issue_description': latest_pending_issue.description if latest_pending_issue else "",
-            'latest_issue_type': latest_pending_issue.issue_type if latest_pending_issue else "",
-            'latest_issue_record_date': latest_pending_issue.record_date if latest_pending_issue else None,
-            
-            # 聚合的沟通记录信息
-            'pending_communications_count': len(pending_communications),
-            'latest_comm_content': latest_pending_comm.content if latest_pending_comm else "",
-            'latest_comm_time': latest_pending_comm.communication_time if latest_pending_comm else None,
-            
-            # 最新反馈
-            'latest_feedback': latest_comm_with_feedback.feedback if latest_comm_with_feedback else ""
         }
         
+        # 聚合数据直接读取room_summary表
+        if summary:
+            room_summary.update({
+                'pending_issues_count': summary.pending_issues_count,
+                'latest_issue_description': summary.latest_issue_description,
+                'latest_issue_type': summary.latest_issue_type,
+                'latest_issue_record_date': summary.latest_issue_record_date,
+                'pending_communications_count': summary.pending_communications_count,
+                'latest_comm_content': summary.latest_comm_content,
+                'latest_comm_time': summary.latest_comm_time,
+                'latest_feedback': summary.latest_feedback
+            })
+        else:
+            room_summary.update(_summary_fields())
+        
         rooms_with_summary.append(room_summary)
     
     return {
-        "total_rooms": len(rooms),
+        "total_rooms": sum(status_count.values()),
         "status_summary": status_count,
         "delivery_summary": delivery_count,
         "contract_summary": contract_count,
-        "rooms": rooms_with_summary
+        "filtered_total": sum(filtered_status_count.values()),
+        "filtered_summary": {
+            "status_summary": filtered_status_count,
+            "delivery_summary": filtered_delivery_count,
+            "contract_summary": filtered_contract_count
+        },
+        "rooms": rooms_with_summary,
+        "next_cursor": next_cursor
     }
 
+@write_transaction
 def clear_room_content(db: Session, room_id: int):
     """清空房间内容数据，保留用户分配和房号
     
@@ -427,6 +895,10 @@ def clear_room_content(db: Session, room_id: int):
     room.letter_status = "无"
     room.pre_leakage = "无"
     
+    # 重置房间汇总数据
+    refresh_room_summary(db, room_id)
+    bump_data_version(db, room_id)
+    
     db.commit()
     
     return {
@@ -436,6 +908,7 @@ def clear_room_content(db: Session, room_id: int):
         "message": f"房间 {room.building_unit}-{room.room_number} 内容已清空，保留用户分配"
     }
 
+@write_transaction
 def clear_all_rooms_content(db: Session):
     """清空所有房间内容数据，保留用户分配和房号
     
@@ -467,6 +940,10 @@ def clear_all_rooms_content(db: Session):
         
         cleared_rooms.append(f"{room.building_unit}-{room.room_number}")
     
+    # 重建所有房间的汇总数据
+    _rebuild_room_summaries(db)
+    bump_data_version(db, *[room.id for room in rooms])
+    
     db.commit()
     
     return {
@@ -482,29 +959,35 @@ def get_customer_by_room_id(db: Session, room_id: int):
     """根据房间ID获取客户信息"""
     return db.query(models.Customer).filter(models.Customer.room_id == room_id).first()
 
+@write_transaction
 def create_customer(db: Session, customer: schemas.CustomerCreate):
     """创建客户信息"""
     db_customer = models.Customer(**customer.dict())
     db.add(db_customer)
+    bump_data_version(db, customer.room_id)
     db.commit()
     db.refresh(db_customer)
     return db_customer
 
+@write_transaction
 def update_customer(db: Session, customer_id: int, customer: schemas.CustomerUpdate):
     """更新客户信息"""
     db_customer = db.query(models.Customer).filter(models.Customer.id == customer_id).first()
     if db_customer:
         for key, value in customer.dict(exclude_unset=True).items():
             setattr(db_customer, key, value)
+        bump_data_version(db, db_customer.room_id)
         db.commit()
         db.refresh(db_customer)
     return db_customer
 
+@write_transaction
 def delete_customer(db: Session, customer_id: int):
     """删除客户信息"""
     db_customer = db.query(models.Customer).filter(models.Customer.id == customer_id).first()
     if db_customer:
         db.delete(db_customer)
+        bump_data_version(db, db_customer.room_id)
         db.commit()
         return True
     return False
@@ -518,4 +1001,142 @@ def check_id_card_exists(db: Session, id_card: str, exclude_customer_id: int = N
     query = db.query(models.Customer).filter(models.Customer.id_card == id_card)
     if exclude_customer_id:
         query = query.filter(models.Customer.id != exclude_customer_id)
-    return query.first() is not None
\ No newline at end of file
+    return query.first() is not None
+
+# Room PDF export
+def _build_room_pdf_data(room, customer, communications, quality_issues, assignments):
+    """将房间相关记录整理为 create_room_communication_pdf 的参数
+    
+    communications 按沟通时间降序排列，quality_issues 需已加载录入人，assignments 需已加载用户
+    """
+    room_info = {
+        'building_unit': room.building_unit,
+        'room_number': room.room_number,
+        'expected_delivery_date': room.expected_delivery_date
+    }
+    
+    customer_info = None
+    if customer:
+        customer_info = {
+            'name': customer.name,
+            'gender': customer.gender,
+            'id_card': customer.id_card,
+            'phone': customer.phone,
+            'customer_level': customer.customer_level,
+            'work_unit': customer.work_unit
+        }
+    
+    communication_items = []
+    latest_customer_description = ""
+    for comm in communications:
+        communication_items.append({
+            'content': comm.content,
+            'communication_time': comm.communication_time,
+            'feedback': comm.feedback,
+            'customer_description': comm.customer_description,
+            'created_at': comm.created_at
+        })
+        if comm.customer_description and not latest_customer_description:
+            latest_customer_description = comm.customer_description
+    
+    quality_issue_items = [
+        {
+            'description': issue.description,
+            'status': issue.status,
+            'created_at': issue.created_at,
+            'user_name': issue.user.name if issue.user else ''
+        }
+        for issue in quality_issues
+    ]
+    
+    assigned_users = {'maintenance_engineer': '', 'customer_ambassador': ''}
+    for assignment in assignments:
+        user = assignment.user
+        if user.role == 'maintenance_engineer':
+            assigned_users['maintenance_engineer'] = user.name
+        elif user.role == 'customer_ambassador':
+            assigned_users['customer_ambassador'] = user.name
+    
+    return {
+        'room_info': room_info,
+        'customer_info': customer_info,
+        'communications': communication_items,
+        'quality_issues': quality_issue_items,
+        'assigned_users': assigned_users,
+        'latest_customer_description': latest_customer_description
+    }
+
+def get_room_pdf_data(db: Session, room_id: int, user_id: Optional[int] = None):
+    """获取导出房间沟通记录PDF所需的数据，即 create_room_communication_pdf 的参数
+    
+    指定了user_id时检查房间权限，房间不存在或无权限时返回None
+    """
+    room = get_room_by_id(db, room_id, user_id=user_id)
+    if not room:
+        return None
+    
+    assignments = db.query(models.UserRoom).options(joinedload(models.UserRoom.user)).filter(
+        models.UserRoom.room_id == room_id
+    ).order_by(models.UserRoom.id).all()
+    return _build_room_pdf_data(
+        room,
+        get_customer_by_room_id(db, room_id),
+        get_communications(db, room_id),
+        get_quality_issues(db, room_id),
+        assignments
+    )
+
+def get_building_unit_room_ids(db: Session, building_unit: str) -> List[int]:
+    """楼栋单元下所有房间的ID，按房号排序"""
+    rows = db.query(models.Room.id).filter(
+        models.Room.building_unit == building_unit
+    ).order_by(models.Room.room_number, models.Room.id)
+    return [room_id for room_id, in rows]
+
+def get_rooms_pdf_data(db: Session, room_ids: List[int]):
+    """批量获取多个房间导出PDF所需的数据，返回 (房间ID, 数据) 列表，顺序与room_ids一致
+    
+    房间、客户、沟通记录、质量问题和用户分配各用一次查询取出，不存在的房间跳过
+    """
+    if not room_ids:
+        return []
+    rooms = {room.id: room for room in db.query(models.Room).filter(models.Room.id.in_(room_ids))}
+    customers = {}
+    for customer in db.query(models.Customer).filter(models.Customer.room_id.in_(room_ids)).order_by(models.Customer.id):
+        # 与 get_customer_by_room_id 一致，每个房间取第一条客户信息
+        customers.setdefault(customer.room_id, customer)
+    
+    communications = {}
+    order_keys = _communication_order_keys()
+    comm_query = db.query(models.Communication).join(
+        models.User, models.Communication.user_id == models.User.id
+    ).options(contains_eager(models.Communication.user)).filter(
+        models.Communication.room_id.in_(room_ids)
+    ).order_by(models.Communication.room_id, *[desc(expr) if descending else expr for expr, descending in order_keys])
+    for comm in comm_query:
+        communications.setdefault(comm.room_id, []).append(comm)
+    
+    quality_issues = {}
+    issue_query = db.query(models.QualityIssue).options(joinedload(models.QualityIssue.user)).filter(
+        models.QualityIssue.room_id.in_(room_ids)
+    ).order_by(models.QualityIssue.id)
+    for issue in issue_query:
+        quality_issues.setdefault(issue.room_id, []).append(issue)
+    
+    assignments = {}
+    assignment_query = db.query(models.UserRoom).options(joinedload(models.UserRoom.user)).filter(
+        models.UserRoom.room_id.in_(room_ids)
+    ).order_by(models.UserRoom.id)
+    for assignment in assignment_query:
+        assignments.setdefault(assignment.room_id, []).append(assignment)
+    
+    return [
+        (room_id, _build_room_pdf_data(
+            rooms[room_id],
+            customers.get(room_id),
+            communications.get(room_id, []),
+            quality_issues.get(room_id, []),
+            assignments.get(room_id, [])
+        ))
+        for room_id in room_ids if room_id in rooms
+    ]
@@ -1,14 +1,149 @@
-from sqlalchemy import create_engine
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import MissingGreenlet, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.util import await_only
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./zwy_project.db"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./zwy_project.db")
+# 异步接口使用的连接地址，默认与同步引擎指向同一个数据库文件
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
 )
+
+# SQLite连接参数配置档：
+#   default 保持SQLite默认设置（回滚日志、每次提交完整同步）
+#   tuned   WAL日志模式，读写互不阻塞，提交时只追加WAL文件
+SQLITE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,       # 负数表示KiB，即64MB页缓存
+        "mmap_size": 268435456,     # 256MB内存映射
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+
+def get_sqlite_pragmas(profile: str = None) -> dict:
+    """返回配置档对应的PRAGMA设置，可通过 SQLITE_<PRAGMA名> 环境变量单独覆盖"""
+    profile = profile or SQLITE_PROFILE
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"未知的SQLite配置档: {profile}，可选值: {', '.join(SQLITE_PROFILES)}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES["tuned"]:
+        override = os.getenv(f"SQLITE_{name.upper()}")
+        if override:
+            pragmas[name] = override
+    return pragmas
+
+def apply_sqlite_pragmas(engine, pragmas: dict):
+    """在引擎的每个新连接上执行PRAGMA设置，异步引擎传入 async_engine.sync_engine"""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+# 为真时新开启的事务使用 BEGIN IMMEDIATE，由 write_transaction 在写操作期间设置
+_begin_immediate = ContextVar("begin_immediate", default=False)
+
+def enable_sqlite_transaction_control(engine):
+    """由SQLAlchemy显式发出BEGIN语句，写操作可以在事务开始时就获取写锁
+
+    pysqlite默认在第一条修改语句前才隐式开始事务，读事务升级为写事务时
+    遇到并发写入会直接报 database is locked，不会等待 busy_timeout
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        if not _begin_immediate.get():
+            conn.exec_driver_sql("BEGIN")
+            return
+        started_at = time.perf_counter()
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        finally:
+            write_retry_stats.record_lock_wait(time.perf_counter() - started_at)
+
+@contextmanager
+def immediate_transaction(engine):
+    """用法同 engine.begin()，SQLite下以 BEGIN IMMEDIATE 开始事务，开始时即持有写锁"""
+    with engine.connect() as connection:
+        token = _begin_immediate.set(True)
+        try:
+            transaction = connection.begin()
+        finally:
+            _begin_immediate.reset(token)
+        with transaction:
+            yield connection
+
+def read_sqlite_pragmas(connection) -> dict:
+    """读取连接上实际生效的PRAGMA值"""
+    return {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in SQLITE_PROFILES["tuned"]
+    }
+
+def create_database_engine(url: str, profile: str = None):
+    """创建同步引擎，SQLite数据库按配置档设置PRAGMA"""
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args)
+    apply_sqlite_pragmas(engine, get_sqlite_pragmas(profile))
+    enable_sqlite_transaction_control(engine)
+    return engine
+
+def log_sqlite_pragmas():
+    """启动时记录数据库地址、配置档和实际生效的PRAGMA值"""
+    if engine.dialect.name != "sqlite":
+        logger.info("数据库: %s", engine.url.render_as_string(hide_password=True))
+        return
+    with engine.connect() as connection:
+        effective = read_sqlite_pragmas(connection)
+    logger.info(
+        "数据库: %s，SQLite配置档: %s，生效的PRAGMA: %s",
+        engine.url.render_as_string(hide_password=True), SQLITE_PROFILE,
+        ", ".join(f"{name}={value}" for name, value in effective.items())
+    )
+
+engine = create_database_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎，供 async def 接口使用，数据库IO不会阻塞事件循环
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+apply_sqlite_pragmas(async_engine.sync_engine, get_sqlite_pragmas())
+# 异步接口的写操作通过 run_sync 调用 write_transaction 装饰的函数，同样以 BEGIN IMMEDIATE 开始事务
+enable_sqlite_transaction_control(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -16,4 +151,145 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# 写事务重试配置
+WRITE_RETRY_ATTEMPTS = int(os.getenv("WRITE_RETRY_ATTEMPTS", "5"))
+WRITE_RETRY_BASE_DELAY = float(os.getenv("WRITE_RETRY_BASE_DELAY", "0.05"))
+WRITE_RETRY_MAX_DELAY = float(os.getenv("WRITE_RETRY_MAX_DELAY", "1.0"))
+
+class WriteRetryStats:
+    """写事务统计：获取写锁的等待时间、重试次数和最终失败次数"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.transactions = 0
+        self.retries = 0
+        self.failures = 0
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        self.retries_by_function = {}
+    
+    def record_transaction(self):
+        with self._lock:
+            self.transactions += 1
+    
+    def record_retry(self, function_name: str, wait: float):
+        with self._lock:
+            self.retries += 1
+            self.retries_by_function[function_name] = self.retries_by_function.get(function_name, 0) + 1
+            self.lock_wait_total += wait
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+    
+    def record_lock_wait(self, wait: float):
+        with self._lock:
+            self.lock_waits += 1
+            self.lock_wait_total += wait
+            self.lock_wait_max = max(self.lock_wait_max, wait)
+    
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_attempts": WRITE_RETRY_ATTEMPTS,
+                "transactions": self.transactions,
+                "retries": self.retries,
+                "failures": self.failures,
+                "lock_wait_total_ms": round(self.lock_wait_total * 1000, 2),
+                "lock_wait_avg_ms": round(self.lock_wait_total / self.transactions * 1000, 2) if self.transactions else 0.0,
+                "lock_wait_max_ms": round(self.lock_wait_max * 1000, 2),
+                "retries_by_function": dict(self.retries_by_function)
+            }
+
+write_retry_stats = WriteRetryStats()
+
+def is_lock_error(error: Exception) -> bool:
+    """判断是否为SQLite写锁冲突（database is locked / busy）"""
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig).lower()
+    return "database is locked" in message or "database is busy" in message or "database table is locked" in message
+
+@event.listens_for(Session, "after_commit")
+def _after_write_commit(session):
+    # 写操作提交后剩余的只是刷新返回对象等读取，不再占用写锁；提交后也不能再整体重试
+    if session.info.get("write_transaction"):
+        session.info["write_committed"] = True
+        _begin_immediate.set(False)
+
+def _total_changes(connection):
+    """SQLite连接累计修改的行数，其他数据库返回None"""
+    return getattr(connection.connection.driver_connection, "total_changes", None)
+
+@event.listens_for(Session, "after_begin")
+def _record_changes_at_begin(session, transaction, connection):
+    session.info["changes_at_begin"] = _total_changes(connection)
+
+def _has_uncommitted_writes(db) -> bool:
+    """调用方的当前事务中是否有未提交的修改，包括已flush的修改和直接执行的写语句"""
+    if db.new or db.dirty or db.deleted:
+        return True
+    if not db.in_transaction():
+        return False
+    changes = _total_changes(db.connection())
+    # 无法判断时按有修改处理
+    return changes is None or changes != db.info.get("changes_at_begin")
+
+def _retry_sleep(delay: float):
+    """在 AsyncSession.run_sync 中执行时让出事件循环等待，否则阻塞当前线程等待"""
+    try:
+        await_only(asyncio.sleep(delay))
+    except MissingGreenlet:
+        time.sleep(delay)
+
+def write_transaction(func):
+    """写操作装饰器：以 BEGIN IMMEDIATE 开始事务，遇到锁冲突时回滚并按指数退避加随机抖动重试
+
+    被装饰函数的第一个参数为Session，由函数自身提交事务；函数未提交时（如记录不存在）回滚以释放写锁。
+    嵌套调用或调用方的事务中已有未提交的修改（包括已flush的修改）时直接在当前事务中执行，不做重试，
+    不会替调用方提交其修改。异步Session通过 run_sync 调用，重试等待时不阻塞事件循环。
+    """
+    @functools.wraps(func)
+    def wrapper(db, *args, **kwargs):
+        if db.info.get("write_transaction") or _has_uncommitted_writes(db):
+            return func(db, *args, **kwargs)
+        if db.in_transaction():
+            # 结束调用方的只读事务，否则无法以 BEGIN IMMEDIATE 重新开始
+            db.commit()
+        
+        write_retry_stats.record_transaction()
+        attempt = 1
+        while True:
+            token = _begin_immediate.set(True)
+            db.info["write_transaction"] = True
+            try:
+                result = func(db, *args, **kwargs)
+                if db.in_transaction() and not db.info.get("write_committed"):
+                    db.rollback()
+                return result
+            except OperationalError as e:
+                db.rollback()
+                if not is_lock_error(e) or db.info.get("write_committed") or attempt >= WRITE_RETRY_ATTEMPTS:
+                    if is_lock_error(e):
+                        write_retry_stats.record_failure()
+                    raise
+            finally:
+                db.info.pop("write_transaction", None)
+                db.info.pop("write_committed", None)
+                _begin_immediate.reset(token)
+            
+            delay = min(WRITE_RETRY_MAX_DELAY, WRITE_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.5)
+            logger.warning("%s 遇到数据库锁冲突，%.0fms 后进行第 %d 次重试", func.__name__, delay * 1000, attempt)
+            _retry_sleep(delay)
+            write_retry_stats.record_retry(func.__name__, delay)
+            attempt += 1
+    
+    return wrapper
@@ -6,9 +6,11 @@ from database import engine
 import models
 from sqlalchemy.orm import sessionmaker
 import auth
+import crud
+from migrations import run_migrations
 
-# 创建数据库表
-models.Base.metadata.create_all(bind=engine)
+# 创建数据库表，并记录迁移版本
+run_migrations()
 
 # 创建数据库会话
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -137,6 +139,9 @@ try:
                 db.add(comm)
     
     db.commit()
+    
+    # 根据示例数据统计房间汇总和待验收问题数
+    crud.rebuild_room_summaries(db)
     print("数据库初始化完成！")
     print("\n默认账号:")
     print("管理员: admin / admin123")
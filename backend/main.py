@@ -1,23 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import models, schemas, crud
-from database import SessionLocal, engine, get_db
+from database import SessionLocal, engine, async_engine, get_db, get_async_db, log_sqlite_pragmas, write_retry_stats
 import auth
+from migrations import run_migrations
+import sql_monitor
+import metrics
+import profiler
+import slow_query_log
+import pdf_cache
+from bulk_pdf_export import export_jobs, stream_building_unit_zip
+from pdf_render_pool import pdf_render_pool, pdf_render_stats, PdfRenderQueueFull, PDF_RENDER_RETRY_AFTER
+from write_coalescer import write_coalescer, WriteQueueTimeout, WRITE_COALESCING_ENABLED
 from typing import List
+from datetime import date
+import logging
 import os
 import uuid
 import shutil
 import io
-from pdf_generator import create_room_communication_pdf
+import hashlib
+from urllib.parse import quote
+from pdf_generator import register_chinese_fonts
 
-models.Base.metadata.create_all(bind=engine)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI(title="ZWY项目信息跟踪管理系统", version="1.0.0")
 
+# 数据库迁移等初始化放在启动事件中而不是模块顶层：PDF生成工作进程以spawn方式启动，
+# 通过 python main.py 运行时子进程会重新导入本模块，不能在子进程中重复执行
+@app.on_event("startup")
+def initialize_database_and_fonts():
+    # 创建缺少的表；create_all 不会修改已存在的表，字段和索引的变更由版本迁移补齐
+    run_migrations()
+    log_sqlite_pragmas()
+    
+    # 启动时查找并注册PDF中文字体，导出PDF时不再重复解析字体文件
+    register_chinese_fonts()
+    
+    # 补齐缺失的房间汇总数据（旧数据库首次升级时会整体重建）
+    with SessionLocal() as db:
+        crud.ensure_room_summaries(db)
+
+# 管理员按需分析单个请求的耗时分布，路由类需在声明接口之前设置
+if profiler.REQUEST_PROFILING_ENABLED:
+    app.router.route_class = profiler.ProfiledRoute
+    app.add_middleware(profiler.ProfilerMiddleware)
+
+# 按请求统计SQL语句数和数据库耗时
+sql_monitor.instrument_engine(engine)
+sql_monitor.instrument_engine(async_engine.sync_engine)
+app.middleware("http")(sql_monitor.sql_monitor_middleware)
+
+# 记录超过阈值的慢查询及其查询计划
+slow_query_log.instrument_engine(engine)
+slow_query_log.instrument_engine(async_engine.sync_engine)
+
+# 运行指标：统计连接池取出次数
+metrics.instrument_pool(engine, "sync")
+metrics.instrument_pool(async_engine.sync_engine, "async")
+
+# Prometheus抓取指标时使用的令牌，未设置时 /metrics 不需要认证
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 # 创建上传文件夹
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -32,17 +83,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Export-Job-Id"],
 )
+# 最后注册的中间件位于最外层，请求统计包含其他中间件的耗时
+app.add_middleware(metrics.MetricsMiddleware)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+@app.on_event("shutdown")
+def shutdown_background_workers():
+    # 等待已提交的合并写入落盘
+    write_coalescer.shutdown()
+    # 停止PDF生成工作进程
+    pdf_render_pool.shutdown()
+
+def check_not_modified(request: Request, response: Response, version: int, current_user: models.User):
+    """根据数据版本号生成ETag，客户端缓存仍有效时返回304响应
+    
+    ETag包含版本号、用户和查询参数，同一版本下不同用户或不同筛选条件互不影响
+    """
+    raw = f"{version}:{current_user.id}:{current_user.role}:{request.url.path}?{request.url.query}"
+    etag = f'W/"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response.headers.update(headers)
+    return None
+
 @app.get("/")
 async def root():
     return {"message": "ZWY项目信息跟踪管理系统 API", "status": "运行中"}
 
 @app.post("/token", response_model=schemas.Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,8 +132,13 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": access_token, "token_type": "bearer", "user": user}
 
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
-    return current_user
+def read_users_me(db: Session = Depends(get_db),
+                  current_user: models.User = Depends(auth.get_current_user)):
+    # 身份缓存只保存基本字段，完整用户信息从数据库读取
+    user = crud.get_user(db, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return user
 
 # 用户管理接口
 @app.post("/users/", response_model=schemas.User)
@@ -104,12 +188,17 @@ def delete_user(user_id: int, db: Session = Depends(get_db),
 
 # 房间管理接口
 @app.get("/rooms/", response_model=List[schemas.Room])
-def read_rooms(db: Session = Depends(get_db), 
-               current_user: models.User = Depends(auth.get_current_user)):
+async def read_rooms(request: Request, response: Response, db: AsyncSession = Depends(get_async_db), 
+                     current_user: models.User = Depends(auth.get_current_user)):
+    version = await db.run_sync(crud.get_data_version)
+    not_modified = check_not_modified(request, response, version, current_user)
+    if not_modified:
+        return not_modified
+    
     if current_user.role == "admin":
-        return crud.get_rooms(db)
+        return await db.run_sync(crud.get_rooms)
     else:
-        return crud.get_user_rooms(db, current_user.id)
+        return await db.run_sync(crud.get_user_rooms, current_user.id)
 
 @app.get("/rooms/{room_id}", response_model=schemas.Room)
 def get_room(room_id: int, db: Session = Depends(get_db),
@@ -135,124 +224,107 @@ def delete_room(room_id: int, db: Session = Depends(get_db),
     success = crud.delete_room(db=db, room_id=room_id)
     if not success:
         raise HTTPException(status_code=404, detail="房间不存在")
+    pdf_cache.pdf_cache.invalidate_room(room_id)
     
     return {"message": "房间删除成功"}
 
+def iter_file(file, chunk_size: int = 64 * 1024):
+    """分块读取文件用于流式响应"""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
 @app.get("/rooms/{room_id}/export-pdf")
 def export_room_pdf(room_id: int, db: Session = Depends(get_db),
                     current_user: models.User = Depends(auth.get_current_user)):
     """导出房间沟通记录PDF"""
     try:
-        # 检查房间访问权限
-        room = crud.get_room_by_id(db=db, room_id=room_id, user_id=current_user.id if current_user.role != "admin" else None)
-        if not room:
+        # 检查房间访问权限并获取生成PDF所需的数据
+        pdf_data = crud.get_room_pdf_data(db, room_id, user_id=current_user.id if current_user.role != "admin" else None)
+        if not pdf_data:
             raise HTTPException(status_code=404, detail="房间不存在或无权限访问")
+        room_info = pdf_data['room_info']
         
-        # 获取房间相关数据
-        room_dict = {
-            'building_unit': room.building_unit,
-            'room_number': room.room_number,
-            'expected_delivery_date': room.expected_delivery_date
-        }
-        
-        # 获取客户信息
-        customer_info = None
-        try:
-            customer = crud.get_customer_by_room_id(db, room_id)
-            if customer:
-                customer_info = {
-                    'name': customer.name,
-                    'gender': customer.gender,
-                    'id_card': customer.id_card,
-                    'phone': customer.phone,
-                    'customer_level': customer.customer_level,
-                    'work_unit': customer.work_unit
-                }
-        except:
-            pass
-        
-        # 获取沟通记录
-        communications = crud.get_communications(db, room_id)
-        comm_list = []
-        latest_customer_description = ""
-        
-        for comm in communications:
-            comm_dict = {
-                'content': comm.content,
-                'communication_time': comm.communication_time,
-                'feedback': comm.feedback,
-                'customer_description': comm.customer_description,
-                'created_at': comm.created_at
-            }
-            comm_list.append(comm_dict)
-            
-            if comm.customer_description and not latest_customer_description:
-                latest_customer_description = comm.customer_description
-        
-        # 获取质量问题
-        quality_issues = crud.get_quality_issues(db, room_id)
-        issue_list = []
-        for issue in quality_issues:
-            issue_dict = {
-                'description': issue.description,
-                'status': issue.status,
-                'created_at': issue.created_at,
-                'user_name': issue.user.name if issue.user else ''
-            }
-            issue_list.append(issue_dict)
-        
-        # 获取分配的用户信息
-        assigned_users = {'maintenance_engineer': '', 'customer_ambassador': ''}
-        assignments = db.query(models.UserRoom).filter(models.UserRoom.room_id == room_id).all()
-        for assignment in assignments:
-            user = assignment.user
-            if user.role == 'maintenance_engineer':
-                assigned_users['maintenance_engineer'] = user.name
-            elif user.role == 'customer_ambassador':
-                assigned_users['customer_ambassador'] = user.name
-        
-        # 生成PDF
-        pdf_bytes = create_room_communication_pdf(
-            room_info=room_dict,
-            customer_info=customer_info,
-            communications=comm_list,
-            quality_issues=issue_list,
-            assigned_users=assigned_users,
-            latest_customer_description=latest_customer_description
-        )
-        
-        # 创建临时文件并返回
-        import tempfile
-        import os
-        from fastapi.responses import FileResponse
-        from urllib.parse import quote
-        
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(pdf_bytes)
-            temp_file_path = temp_file.name
+        # 数据没有变化时直接读取缓存的PDF文件，否则生成后从内存返回
+        pdf_file, pdf_size = pdf_cache.open_or_create_pdf(room_id, pdf_data, pdf_render_pool.render)
         
         # 生成友好的中文文件名
-        chinese_filename = f"瑧湾悦二期-{room.building_unit}-{room.room_number}-沟通记录.pdf"
+        chinese_filename = f"瑧湾悦二期-{room_info['building_unit']}-{room_info['room_number']}-沟通记录.pdf"
         encoded_filename = quote(chinese_filename.encode('utf-8'))
         
-        # 清理临时文件的后台任务
-        import atexit
-        atexit.register(lambda: os.unlink(temp_file_path) if os.path.exists(temp_file_path) else None)
-        
-        return FileResponse(
-            path=temp_file_path,
-            filename=f"ZWY-{room.building_unit.replace('单元', '')}-{room.room_number}.pdf",
+        return StreamingResponse(
+            iter_file(pdf_file),
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            }
+                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+                "Content-Length": str(pdf_size)
+            },
+            # 客户端中途断开时也关闭文件
+            background=BackgroundTask(pdf_file.close)
         )
         
+    except HTTPException:
+        raise
+    except PdfRenderQueueFull:
+        raise HTTPException(status_code=503, detail="PDF导出请求过多，请稍后重试",
+                            headers={"Retry-After": str(PDF_RENDER_RETRY_AFTER)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF生成失败: {str(e)}")
 
-# 房间分配接口
+def building_unit_zip_response(job) -> StreamingResponse:
+    """以ZIP压缩包边生成边返回导出任务中所有房间的沟通记录PDF"""
+    chunks = stream_building_unit_zip(job)
+    encoded_filename = quote(f"瑧湾悦二期-{job.building_unit}-沟通记录.zip".encode('utf-8'))
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+            "X-Export-Job-Id": job.id
+        },
+        # 客户端中途断开时迭代器不会被关闭，需显式关闭以停止生成剩余的PDF
+        background=BackgroundTask(chunks.close)
+    )
+
+def create_building_unit_export_job(building_unit: str, db: Session, current_user: models.User):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    room_ids = crud.get_building_unit_room_ids(db, building_unit)
+    if not room_ids:
+        raise HTTPException(status_code=404, detail="该楼栋单元没有房间")
+    return export_jobs.create(building_unit, room_ids)
+
+@app.get("/admin/building-units/{building_unit}/export-pdf")
+def export_building_unit_pdfs(building_unit: str, db: Session = Depends(get_db),
+                              current_user: models.User = Depends(auth.get_current_user)):
+    """导出楼栋单元所有房间的沟通记录PDF，以ZIP压缩包边生成边返回
+    
+    响应头 X-Export-Job-Id 为导出任务ID，可通过 /admin/export-jobs/{job_id} 查询进度
+    """
+    job = create_building_unit_export_job(building_unit, db, current_user)
+    job.start()
+    return building_unit_zip_response(job)
+
+@app.post("/admin/building-units/{building_unit}/export-jobs")
+def create_building_unit_export(building_unit: str, db: Session = Depends(get_db),
+                                current_user: models.User = Depends(auth.get_current_user)):
+    """创建楼栋单元PDF批量导出任务，返回任务ID和下载地址
+    
+    浏览器直接打开下载地址即可边接收边保存压缩包，下载地址只能使用一次
+    """
+    job = create_building_unit_export_job(building_unit, db, current_user)
+    return {"job_id": job.id, "total": job.total, "download_url": f"/admin/export-jobs/{job.id}/download"}
+
+@app.get("/admin/export-jobs/{job_id}/download")
+def download_export_job(job_id: str):
+    """下载导出任务的ZIP压缩包，任务ID即下载凭证（浏览器直接下载时无法附带认证头）"""
+    job = export_jobs.get(job_id)
+    if not job or not job.claim():
+        raise HTTPException(status_code=404, detail="导出任务不存在或下载链接已失效")
+    return building_unit_zip_response(job)
+
 @app.get("/room-assignments/")
 def get_room_assignments(db: Session = Depends(get_db),
                         current_user: models.User = Depends(auth.get_current_user)):
@@ -282,15 +354,62 @@ def delete_room_assignment(assignment_id: int, db: Session = Depends(get_db),
 
 # 质量问题管理接口
 @app.get("/quality-issues/", response_model=List[schemas.QualityIssue])
-def read_quality_issues(room_id: int = None, db: Session = Depends(get_db),
-                       current_user: models.User = Depends(auth.get_current_user)):
-    return crud.get_quality_issues(db, room_id, current_user.id if current_user.role != "admin" else None)
+async def read_quality_issues(request: Request, response: Response, room_id: int = None,
+                              status: str = None, issue_type: str = None,
+                              date_from: date = None, date_to: date = None,
+                              cursor: str = None, limit: int = Query(None, ge=1, le=500),
+                              db: AsyncSession = Depends(get_async_db),
+                              current_user: models.User = Depends(auth.get_current_user)):
+    """质量问题列表，指定limit时按ID游标分页，下一页游标通过X-Next-Cursor响应头返回"""
+    version = await db.run_sync(crud.get_data_version, room_id)
+    not_modified = check_not_modified(request, response, version, current_user)
+    if not_modified:
+        return not_modified
+    
+    filters = dict(
+        room_id=room_id,
+        user_id=current_user.id if current_user.role != "admin" else None,
+        status=status,
+        issue_type=issue_type,
+        date_from=date_from,
+        date_to=date_to,
+        cursor=cursor
+    )
+    try:
+        if limit is None:
+            return await db.run_sync(crud.get_quality_issues, **filters)
+        issues, next_cursor = await db.run_sync(crud.get_quality_issues_page, limit, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return issues
 
 @app.post("/quality-issues/", response_model=schemas.QualityIssue)
 def create_quality_issue(issue: schemas.QualityIssueCreate, db: Session = Depends(get_db),
                         current_user: models.User = Depends(auth.get_current_user)):
+    if WRITE_COALESCING_ENABLED:
+        try:
+            return write_coalescer.write("quality_issue", issue, current_user.id)
+        except WriteQueueTimeout:
+            raise HTTPException(status_code=503, detail="写入请求过多，请稍后重试", headers={"Retry-After": "1"})
     return crud.create_quality_issue(db=db, issue=issue, user_id=current_user.id)
 
+@app.post("/quality-issues/batch-accept")
+def batch_accept_quality_issues(batch: schemas.QualityIssueBatchAccept, db: Session = Depends(get_db),
+                                current_user: models.User = Depends(auth.get_current_user)):
+    """批量验收质量问题，非管理员只能验收分配给自己的房间的问题"""
+    results = crud.accept_quality_issues(
+        db=db,
+        issue_ids=batch.issue_ids,
+        user_id=current_user.id,
+        permission_user_id=current_user.id if current_user.role != "admin" else None
+    )
+    return {
+        "accepted": sum(1 for result in results.values() if result == "accepted"),
+        "results": [{"id": issue_id, "result": result} for issue_id, result in results.items()]
+    }
+
 @app.put("/quality-issues/{issue_id}/accept")
 def accept_quality_issue(issue_id: int, db: Session = Depends(get_db),
                         current_user: models.User = Depends(auth.get_current_user)):
@@ -324,15 +443,41 @@ def update_quality_issue(issue_id: int, issue_update: dict, db: Session = Depend
 
 # 客户沟通管理接口
 @app.get("/communications/", response_model=List[schemas.Communication])
-def read_communications(room_id: int = None, db: Session = Depends(get_db),
-                       current_user: models.User = Depends(auth.get_current_user)):
-    return crud.get_communications(db, room_id, current_user.id if current_user.role != "admin" else None)
+async def read_communications(request: Request, response: Response, room_id: int = None,
+                              cursor: str = None, limit: int = Query(None, ge=1, le=500),
+                              db: AsyncSession = Depends(get_async_db),
+                              current_user: models.User = Depends(auth.get_current_user)):
+    """沟通记录列表，指定limit时按沟通时间游标分页，下一页游标通过X-Next-Cursor响应头返回"""
+    version = await db.run_sync(crud.get_data_version, room_id)
+    not_modified = check_not_modified(request, response, version, current_user)
+    if not_modified:
+        return not_modified
+    
+    filters = dict(
+        room_id=room_id,
+        user_id=current_user.id if current_user.role != "admin" else None,
+        cursor=cursor
+    )
+    try:
+        if limit is None:
+            return await db.run_sync(crud.get_communications, **filters)
+        communications, next_cursor = await db.run_sync(crud.get_communications_page, limit, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return communications
 
 @app.post("/communications/", response_model=schemas.Communication)
 def create_communication(comm: schemas.CommunicationCreate, db: Session = Depends(get_db),
                         current_user: models.User = Depends(auth.get_current_user)):
     if current_user.role not in ["customer_ambassador", "admin"]:
         raise HTTPException(status_code=403, detail="只有客户大使和管理员可以添加沟通记录")
+    if WRITE_COALESCING_ENABLED:
+        try:
+            return write_coalescer.write("communication", comm, current_user.id)
+        except WriteQueueTimeout:
+            raise HTTPException(status_code=503, detail="写入请求过多，请稍后重试", headers={"Retry-After": "1"})
     return crud.create_communication(db=db, communication=comm, user_id=current_user.id)
 
 @app.put("/communications/{communication_id}", response_model=schemas.Communication)
@@ -352,24 +497,20 @@ def update_communication(communication_id: int, update_data: schemas.Communicati
 async def update_room_delivery_status(
     room_id: int,
     delivery_status: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # 只有管理员和客户大使可以更新房间状态
     if current_user.role not in ["admin", "customer_ambassador"]:
         raise HTTPException(status_code=403, detail="权限不足")
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
     # 验证状态值
     if delivery_status not in ["待交付", "已交付"]:
         raise HTTPException(status_code=400, detail="无效的交付状态")
     
-    room.delivery_status = delivery_status
-    db.commit()
-    db.refresh(room)
+    room = await db.run_sync(crud.update_room_fields, room_id, delivery_status=delivery_status)
+    if not room:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
     return {"message": "交付状态更新成功", "delivery_status": delivery_status}
 
@@ -377,24 +518,20 @@ async def update_room_delivery_status(
 async def update_room_contract_status(
     room_id: int,
     contract_status: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # 只有管理员和客户大使可以更新房间状态
     if current_user.role not in ["admin", "customer_ambassador"]:
         raise HTTPException(status_code=403, detail="权限不足")
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
     # 验证状态值
     if contract_status not in ["待签约", "已签约"]:
         raise HTTPException(status_code=400, detail="无效的签约状态")
     
-    room.contract_status = contract_status
-    db.commit()
-    db.refresh(room)
+    room = await db.run_sync(crud.update_room_fields, room_id, contract_status=contract_status)
+    if not room:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
     return {"message": "签约状态更新成功", "contract_status": contract_status}
 
@@ -402,24 +539,20 @@ async def update_room_contract_status(
 async def update_room_letter_status(
     room_id: int,
     letter_status: str = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # 只有管理员和客户大使可以更新房间状态
     if current_user.role not in ["admin", "customer_ambassador"]:
         raise HTTPException(status_code=403, detail="权限不足")
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
     # 验证状态值
     if letter_status not in ["无", "ZX", "SX"]:
         raise HTTPException(status_code=400, detail="无效的信件状态")
     
-    room.letter_status = letter_status
-    db.commit()
-    db.refresh(room)
+    room = await db.run_sync(crud.update_room_fields, room_id, letter_status=letter_status)
+    if not room:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
     return {"message": "信件状态更新成功", "letter_status": letter_status}
 
@@ -427,24 +560,20 @@ async def update_room_letter_status(
 async def update_room_pre_leakage(
     room_id: int,
     pre_leakage: str = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # 只有管理员和客户大使可以更新房间状态
     if current_user.role not in ["admin", "customer_ambassador"]:
         raise HTTPException(status_code=403, detail="权限不足")
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
     # 验证状态值
     if pre_leakage not in ["无", "有"]:
         raise HTTPException(status_code=400, detail="无效的前期渗漏状态")
     
-    room.pre_leakage = pre_leakage
-    db.commit()
-    db.refresh(room)
+    room = await db.run_sync(crud.update_room_fields, room_id, pre_leakage=pre_leakage)
+    if not room:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
     return {"message": "前期渗漏状态更新成功", "pre_leakage": pre_leakage}
 
@@ -452,30 +581,23 @@ async def update_room_pre_leakage(
 async def update_room_expected_delivery_date(
     room_id: int,
     expected_delivery_date: str = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # 只有管理员和客户大使可以更新房间状态
     if current_user.role not in ["admin", "customer_ambassador"]:
         raise HTTPException(status_code=403, detail="权限不足")
     
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
     # 解析日期字符串
     from datetime import datetime
     try:
-        if expected_delivery_date:
-            parsed_date = datetime.strptime(expected_delivery_date, '%Y-%m-%d').date()
-            room.expected_delivery_date = parsed_date
-        else:
-            room.expected_delivery_date = None
+        parsed_date = datetime.strptime(expected_delivery_date, '%Y-%m-%d').date() if expected_delivery_date else None
     except ValueError:
         raise HTTPException(status_code=400, detail="日期格式不正确，应为YYYY-MM-DD")
     
-    db.commit()
-    db.refresh(room)
+    room = await db.run_sync(crud.update_room_fields, room_id, expected_delivery_date=parsed_date)
+    if not room:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
     return {"message": "预计交付时间更新成功", "expected_delivery_date": expected_delivery_date}
 
@@ -495,16 +617,157 @@ async def upload_image(file: UploadFile = File(...),
     # 保存文件
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
+        metrics.upload_bytes_total.inc(amount=buffer.tell())
+    metrics.upload_files_total.inc()
     
     return {"filename": unique_filename, "url": f"/uploads/{unique_filename}"}
 
+# 运行监控接口
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Prometheus文本格式的运行指标"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="指标令牌无效")
+    return Response(content=metrics.registry.expose(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/auth-cache")
+def get_auth_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """用户身份缓存命中统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return auth.user_cache.stats()
+
+@app.get("/admin/password-hashing")
+def get_password_hashing_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """密码哈希线程池的排队和执行时间统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return auth.password_hash_stats.snapshot()
+
+@app.get("/admin/write-retries")
+def get_write_retry_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """写事务的锁等待时间和锁冲突重试统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return write_retry_stats.snapshot()
+
+@app.get("/admin/write-coalescer")
+def get_write_coalescer_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """合并写入的批次数量和批量大小统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return write_coalescer.stats()
+
+@app.get("/admin/sql-stats")
+def get_sql_stats(reset: bool = False, current_user: models.User = Depends(auth.get_current_user)):
+    """各路由的SQL语句数、数据库耗时和疑似N+1查询统计，reset=true时返回后清空"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    summary = sql_monitor.route_sql_stats.summary()
+    if reset:
+        sql_monitor.route_sql_stats.reset()
+    return {"n_plus_one_threshold": sql_monitor.SQL_N_PLUS_ONE_THRESHOLD, "routes": summary}
+
+@app.get("/admin/pdf-rendering")
+def get_pdf_rendering_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """PDF生成进程池的排队等待时间、生成时间和拒绝次数统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return pdf_render_stats.snapshot()
+
+@app.get("/admin/export-jobs")
+def list_export_jobs(current_user: models.User = Depends(auth.get_current_user)):
+    """最近的批量导出任务及其进度"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return export_jobs.list()
+
+@app.get("/admin/export-jobs/{job_id}")
+def get_export_job(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    """查询批量导出任务的进度"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return job.to_dict()
+
+@app.get("/admin/pdf-cache")
+def get_pdf_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """导出PDF缓存的命中、淘汰统计"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return pdf_cache.pdf_cache.stats()
+
+@app.get("/admin/slow-queries")
+def get_slow_queries(limit: int = Query(50, ge=1, le=1000),
+                     current_user: models.User = Depends(auth.get_current_user)):
+    """最近的慢查询记录，包括绑定参数、调用的crud函数和查询计划"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return {"enabled": slow_query_log.SLOW_QUERY_LOG_ENABLED, "threshold_ms": slow_query_log.SLOW_QUERY_MS,
+            "entries": slow_query_log.recent_slow_queries(limit)}
+
+@app.get("/admin/profiles")
+def get_profiles(current_user: models.User = Depends(auth.get_current_user)):
+    """最近的请求性能分析记录"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return {"enabled": profiler.REQUEST_PROFILING_ENABLED, "keep": profiler.PROFILE_KEEP,
+            "profiles": profiler.list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    """下载折叠栈格式的分析结果，可用 flamegraph.pl 或 speedscope 生成火焰图"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+    return Response(content=profiler.read_profile(profile_id), media_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+
 # 管理员汇总接口
 @app.get("/admin/summary")
-def get_summary(building_unit: str = None, db: Session = Depends(get_db),
-                current_user: models.User = Depends(auth.get_current_user)):
+async def get_summary(request: Request,
+                      response: Response,
+                      building_unit: str = None,
+                      status: str = None,
+                      delivery_status: str = None,
+                      contract_status: str = None,
+                      letter_status: str = None,
+                      pre_leakage: str = None,
+                      has_pending_issues: bool = None,
+                      has_pending_communications: bool = None,
+                      room_number: str = None,
+                      sort: str = "id",
+                      cursor: str = None,
+                      limit: int = Query(None, ge=1, le=500),
+                      db: AsyncSession = Depends(get_async_db),
+                      current_user: models.User = Depends(auth.get_current_user)):
+    """管理员汇总数据，支持筛选、排序和游标分页（不传limit时返回全部房间）"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="权限不足")
-    return crud.get_room_summary(db, building_unit)
+    
+    version = await db.run_sync(crud.get_data_version)
+    not_modified = check_not_modified(request, response, version, current_user)
+    if not_modified:
+        return not_modified
+    
+    try:
+        return await db.run_sync(
+            crud.get_room_summary, building_unit,
+            status=status,
+            delivery_status=delivery_status,
+            contract_status=contract_status,
+            letter_status=letter_status,
+            pre_leakage=pre_leakage,
+            has_pending_issues=has_pending_issues,
+            has_pending_communications=has_pending_communications,
+            room_number=room_number,
+            sort=sort,
+            cursor=cursor,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # 客户信息相关接口
 @app.get("/customers/room/{room_id}", response_model=schemas.Customer)
@@ -594,6 +857,7 @@ def clear_room_content(room_id: int, db: Session = Depends(get_db),
     result = crud.clear_room_content(db=db, room_id=room_id)
     if not result:
         raise HTTPException(status_code=404, detail="房间不存在")
+    pdf_cache.pdf_cache.invalidate_room(room_id)
     
     return result
 
@@ -605,6 +869,7 @@ def clear_all_rooms_content(db: Session = Depends(get_db),
         raise HTTPException(status_code=403, detail="只有管理员可以执行此操作")
     
     result = crud.clear_all_rooms_content(db=db)
+    pdf_cache.pdf_cache.clear()
     return result
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""
+Prometheus文本格式的运行指标
+
+指标保存在进程内的计数器中，每次记录只做一次加锁的字典更新，/metrics 接口按需输出：
+    http_requests_total                   按方法、路由、状态码统计的请求数
+    http_request_duration_seconds         按方法、路由统计的请求耗时直方图
+    http_requests_in_flight               正在处理的请求数
+    db_pool_checkouts_total               数据库连接池取出连接次数
+    db_pool_connections_checked_out       当前已取出的连接数
+    pdf_generation_duration_seconds       PDF生成耗时直方图
+    pdf_render_queue_wait_seconds         PDF生成任务排队等待时间直方图
+    pdf_render_in_flight / pdf_render_rejected_total  正在生成和排队的PDF任务数、因队列已满被拒绝的次数
+    upload_bytes_total / upload_files_total  上传文件的字节数和文件数
+多进程部署时每个进程分别统计。
+"""
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from starlette.routing import Mount
+
+# 请求耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# PDF生成耗时直方图的桶上限（秒）
+PDF_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    """可增可减的数值；指定callback时在输出时调用callback取值"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def expose(self):
+        if self.callback is not None:
+            with self._lock:
+                self._values = dict(self.callback())
+        lines = super().expose()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [各桶计数（最后一个为+Inf）, 总和]
+        self._values = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def expose(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % (_format_value(bound) if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP请求数", ("method", "route", "status")))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（秒）", ("method", "route")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数"))
+db_pool_checkouts_total = registry.register(Counter(
+    "db_pool_checkouts_total", "从数据库连接池取出连接的次数", ("engine",)))
+pdf_generation_duration_seconds = registry.register(Histogram(
+    "pdf_generation_duration_seconds", "PDF生成耗时（秒）", buckets=PDF_BUCKETS))
+pdf_render_queue_wait_seconds = registry.register(Histogram(
+    "pdf_render_queue_wait_seconds", "PDF生成任务排队等待时间（秒）", buckets=LATENCY_BUCKETS + (30.0, 60.0)))
+pdf_render_in_flight = registry.register(Gauge(
+    "pdf_render_in_flight", "正在生成和排队等待的PDF任务数"))
+pdf_render_rejected_total = registry.register(Counter(
+    "pdf_render_rejected_total", "因队列已满被拒绝的PDF生成请求数"))
+upload_bytes_total = registry.register(Counter(
+    "upload_bytes_total", "上传文件的总字节数"))
+upload_files_total = registry.register(Counter(
+    "upload_files_total", "上传文件数"))
+
+_pool_engines = {}
+
+def _checked_out_connections():
+    for name, engine in _pool_engines.items():
+        checkedout = getattr(engine.pool, "checkedout", None)
+        if checkedout is not None:
+            yield (name,), checkedout()
+
+db_pool_connections_checked_out = registry.register(Gauge(
+    "db_pool_connections_checked_out", "当前从连接池取出的连接数", ("engine",), callback=_checked_out_connections))
+
+def instrument_pool(engine, name: str):
+    """统计引擎连接池的取出次数，异步引擎传入 async_engine.sync_engine"""
+    _pool_engines[name] = engine
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts_total.inc(name)
+
+def route_label(scope, path: str) -> str:
+    """路由模板作为标签，避免路径参数导致标签数量无限增长
+
+    path 需传入请求进入路由前的路径，挂载的子应用会改写 scope["path"]
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    app = scope.get("app")
+    for mount in getattr(app, "routes", ()):
+        if isinstance(mount, Mount) and path.startswith(mount.path + "/"):
+            return mount.path + "/{path}"
+    return "unmatched"
+
+class MetricsMiddleware:
+    """统计请求数、耗时和并发数的ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        path = scope["path"]
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            method = scope["method"]
+            route = route_label(scope, path)
+            http_request_duration_seconds.observe(time.perf_counter() - started_at, method, route)
+            http_requests_total.inc(method, route, str(status_code))
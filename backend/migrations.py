@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+数据库版本迁移
+按版本号顺序执行迁移，已执行的版本记录在 schema_migrations 表中，每个版本只执行一次。
+应用启动时自动执行，也可以手动执行：
+
+用法：
+    python migrations.py            # 执行所有未执行的迁移
+    python migrations.py --status   # 查看各版本的执行状态
+
+新增迁移时在 MIGRATIONS 末尾追加，版本号递增，已发布的迁移不要修改。
+迁移中的语句需要兼容 create_all 新建的数据库（字段、索引可能已经存在）。
+"""
+import argparse
+import logging
+import sys
+from sqlalchemy import text
+from database import engine, immediate_transaction
+import models
+
+logger = logging.getLogger(__name__)
+
+def _column_exists(conn, table: str, column: str) -> bool:
+    return conn.execute(
+        text("SELECT COUNT(*) FROM pragma_table_info(:table) WHERE name = :column"),
+        {"table": table, "column": column}
+    ).scalar() > 0
+
+def _has_index_on(conn, table: str, columns) -> bool:
+    """表上是否已有以指定列开头的索引（包括唯一约束自动创建的索引）"""
+    for index in conn.execute(text("SELECT name FROM pragma_index_list(:table)"), {"table": table}):
+        indexed = [row.name for row in conn.execute(
+            text("SELECT name FROM pragma_index_info(:index) ORDER BY seqno"), {"index": index.name}
+        )]
+        if indexed[:len(columns)] == list(columns):
+            return True
+    return False
+
+def _create_index(conn, name: str, table: str, columns, unique: bool = False):
+    """创建索引，已有以相同列开头的索引时跳过"""
+    if _has_index_on(conn, table, columns):
+        return
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+def add_expected_delivery_date(conn):
+    if not _column_exists(conn, "rooms", "expected_delivery_date"):
+        conn.execute(text("ALTER TABLE rooms ADD COLUMN expected_delivery_date DATE DEFAULT NULL"))
+
+def add_communication_time_indexes(conn):
+    # 表达式需与 models.Communication 中的定义一致，查询才能使用索引
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_communications_room_effective_time "
+        "ON communications (room_id, coalesce(communication_time, created_at))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_communications_effective_time "
+        "ON communications (coalesce(communication_time, created_at))"
+    ))
+
+def add_foreign_key_indexes(conn):
+    _create_index(conn, "ix_quality_issues_room_id", "quality_issues", ["room_id"])
+    # ix_communications_room_effective_time 以room_id开头，通常会跳过
+    _create_index(conn, "ix_communications_room_id", "communications", ["room_id"])
+    _create_index(conn, "ix_user_rooms_room_id", "user_rooms", ["room_id"])
+    # customers.room_id 有唯一约束时已自带索引
+    _create_index(conn, "ix_customers_room_id", "customers", ["room_id"])
+    _create_index(conn, "ix_rooms_building_unit_room_number", "rooms", ["building_unit", "room_number"])
+
+def add_user_rooms_unique_index(conn):
+    # 先删除重复的分配，每个(用户, 房间)保留最早的一条
+    deleted = conn.execute(text("""
+        DELETE FROM user_rooms WHERE id NOT IN (
+            SELECT MIN(id) FROM user_rooms GROUP BY user_id, room_id
+        )
+    """)).rowcount
+    if deleted:
+        logger.info("删除了 %d 条重复的房间分配", deleted)
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_rooms_user_id_room_id ON user_rooms (user_id, room_id)"
+    ))
+
+# (版本号, 说明, 迁移函数)
+MIGRATIONS = [
+    (1, "rooms表添加预计交付时间字段", add_expected_delivery_date),
+    (2, "沟通记录按沟通时间排序的索引", add_communication_time_indexes),
+    (3, "外键及房号查询索引", add_foreign_key_indexes),
+    (4, "房间分配去重并添加(user_id, room_id)唯一索引", add_user_rooms_unique_index),
+]
+
+def _ensure_migration_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+def get_applied_versions(conn) -> dict:
+    _ensure_migration_table(conn)
+    return {
+        row.version: row.applied_at
+        for row in conn.execute(text("SELECT version, applied_at FROM schema_migrations"))
+    }
+
+def run_migrations(bind=engine):
+    """创建缺少的表，再按顺序执行未执行的迁移，返回本次执行的 (版本号, 说明) 列表
+
+    每个版本在单独的事务中执行，迁移语句和版本记录一起提交；
+    事务以 BEGIN IMMEDIATE 开始，多个进程同时启动时依次执行，不会重复迁移
+    """
+    with immediate_transaction(bind) as conn:
+        models.Base.metadata.create_all(bind=conn)
+    
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with immediate_transaction(bind) as conn:
+            if version in get_applied_versions(conn):
+                continue
+            logger.info("执行数据库迁移 %d: %s", version, description)
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description}
+            )
+        applied.append((version, description))
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库版本迁移")
+    parser.add_argument("--status", action="store_true", help="只查看迁移状态，不执行")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        with engine.begin() as conn:
+            applied_versions = get_applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            applied_at = applied_versions.get(version)
+            state = f"✅ 已执行 {applied_at}" if applied_at else "⏳ 未执行"
+            print(f"{version:>4}  {description}  {state}")
+        return 0
+
+    try:
+        applied = run_migrations()
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+
+    for version, description in applied:
+        print(f"✅ 已执行迁移 {version}: {description}")
+    if not applied:
+        print("ℹ️  没有需要执行的迁移")
+    print("🎉 数据库迁移完成")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
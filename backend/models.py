@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Date
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Date, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -35,20 +35,30 @@ class Room(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_rooms_building_unit_room_number", building_unit, room_number),
+    )
+    
     # 关系
     user_assignments = relationship("UserRoom", back_populates="room")
     quality_issues = relationship("QualityIssue", back_populates="room")
     communications = relationship("Communication", back_populates="room")
     customer = relationship("Customer", back_populates="room", uselist=False)
+    summary = relationship("RoomSummary", back_populates="room", uselist=False)
 
 class UserRoom(Base):
     __tablename__ = "user_rooms"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    room_id = Column(Integer, ForeignKey("rooms.id"))
+    room_id = Column(Integer, ForeignKey("rooms.id"), index=True)
     created_at = Column(DateTime, server_default=func.now())
     
+    # 同一用户不能重复分配同一房间，同时用作按用户查询分配的索引
+    __table_args__ = (
+        Index("ux_user_rooms_user_id_room_id", user_id, room_id, unique=True),
+    )
+    
     # 关系
     user = relationship("User", back_populates="room_assignments")
     room = relationship("Room", back_populates="user_assignments")
@@ -57,7 +67,7 @@ class QualityIssue(Base):
     __tablename__ = "quality_issues"
     
     id = Column(Integer, primary_key=True, index=True)
-    room_id = Column(Integer, ForeignKey("rooms.id"))
+    room_id = Column(Integer, ForeignKey("rooms.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     description = Column(Text)
     issue_type = Column(String, default="质量瑕疵")  # 质量瑕疵, 材料备货
@@ -87,10 +97,44 @@ class Communication(Base):
     is_implemented = Column(Boolean, default=False)  # 是否已落实
     created_at = Column(DateTime, server_default=func.now())
     
+    # 按沟通时间排序（沟通时间为空时使用创建时间）的表达式索引
+    __table_args__ = (
+        Index("ix_communications_room_effective_time", room_id, func.coalesce(communication_time, created_at)),
+        Index("ix_communications_effective_time", func.coalesce(communication_time, created_at)),
+    )
+    
     # 关系
     room = relationship("Room", back_populates="communications")
     user = relationship("User", back_populates="communications")
 
+class RoomSummary(Base):
+    """房间汇总数据（反范式化），由crud中的写操作在同一事务内维护"""
+    __tablename__ = "room_summary"
+    
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    pending_issues_count = Column(Integer, default=0)  # 待验收问题数
+    latest_issue_description = Column(Text, default="")  # 最新待验收问题描述
+    latest_issue_type = Column(String, default="")  # 最新待验收问题类型
+    latest_issue_record_date = Column(DateTime, nullable=True)  # 最新待验收问题录入时间
+    pending_communications_count = Column(Integer, default=0)  # 待落实沟通记录数
+    latest_comm_content = Column(Text, default="")  # 最新待落实沟通内容
+    latest_comm_time = Column(DateTime, nullable=True)  # 最新待落实沟通时间
+    latest_feedback = Column(Text, default="")  # 最新收房意愿
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    # 关系
+    room = relationship("Room", back_populates="summary")
+
+class DataVersion(Base):
+    """数据版本号，写操作时递增，用于生成读接口的ETag
+    
+    scope 为 "global"（任意数据变更）或 "room:<房间ID>"（该房间相关数据变更）
+    """
+    __tablename__ = "data_versions"
+    
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class Customer(Base):
     __tablename__ = "customers"
     
@@ -0,0 +1,184 @@
+"""
+房间沟通记录PDF的磁盘缓存（可通过环境变量 PDF_CACHE=0 关闭）
+
+缓存键是生成PDF的输入数据（房间、客户、沟通记录、质量问题、分配人员）的哈希，
+数据没有变化时再次导出直接读取缓存文件；数据变化后哈希随之变化，写入新文件时删除
+同一房间的旧文件。缓存总大小超过 PDF_CACHE_MAX_MB 时淘汰最久未使用的文件。
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Optional, Tuple
+import pdf_generator
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_ENABLED = os.getenv("PDF_CACHE", "1") == "1"
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "200"))
+
+def cache_key(pdf_data: dict) -> str:
+    """生成PDF的输入数据的哈希，模板版本和使用的字体也计入其中"""
+    content = json.dumps(
+        {
+            "template_version": pdf_generator.PDF_TEMPLATE_VERSION,
+            "font": pdf_generator.get_font_name(),
+            "data": pdf_data
+        },
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class PdfCache:
+    """文件名为 {房间ID}-{缓存键}.pdf，按最近使用顺序维护文件大小索引"""
+
+    def __init__(self, directory: str = PDF_CACHE_DIR, max_bytes: int = int(PDF_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _load(self):
+        """首次使用时按修改时间加载已有的缓存文件，需持有锁"""
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pdf"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _remove(self, name: str):
+        """从索引中删除并删除文件，需持有锁"""
+        self._total_bytes -= self._entries.pop(name)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def open_file(self, room_id: int, key: str) -> Optional[BinaryIO]:
+        """打开缓存的PDF文件，没有缓存时返回None；文件打开后即使被淘汰删除也能继续读取"""
+        name = f"{room_id}-{key}.pdf"
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+        try:
+            f = open(self._path(name), "rb")
+        except FileNotFoundError:
+            # 文件已被其他进程淘汰
+            with self._lock:
+                if name in self._entries:
+                    self._total_bytes -= self._entries.pop(name)
+                self.misses += 1
+            return None
+        # 更新修改时间，重启后仍按最近使用顺序淘汰
+        try:
+            os.utime(self._path(name))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return f
+
+    def put(self, room_id: int, key: str, data: bytes):
+        name = f"{room_id}-{key}.pdf"
+        with self._lock:
+            self._load()
+        # 先写临时文件再改名，读取方不会读到写了一半的文件
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(name))
+        except OSError:
+            logger.exception("写入PDF缓存失败: %s", name)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            # 同一房间的旧文件对应的是变化前的数据，不会再被读取
+            prefix = f"{room_id}-"
+            for stale in [entry for entry in self._entries if entry.startswith(prefix) and entry != name]:
+                self._remove(stale)
+                self.invalidations += 1
+            if name in self._entries:
+                self._total_bytes -= self._entries[name]
+            self._entries[name] = len(data)
+            self._entries.move_to_end(name)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_room(self, room_id: int):
+        """删除房间的缓存文件"""
+        prefix = f"{room_id}-"
+        with self._lock:
+            self._load()
+            for name in [entry for entry in self._entries if entry.startswith(prefix)]:
+                self._remove(name)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._load()
+            for name in list(self._entries):
+                self._remove(name)
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": PDF_CACHE_ENABLED,
+                "entries": len(self._entries) if self._entries is not None else 0,
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+pdf_cache = PdfCache()
+
+def open_or_create_pdf(room_id: int, pdf_data: dict, render) -> Tuple[BinaryIO, int]:
+    """返回PDF文件对象及其大小
+    
+    数据没有变化时返回打开的缓存文件，否则调用 render(**pdf_data) 生成并写入缓存，返回内存中的PDF
+    """
+    if PDF_CACHE_ENABLED:
+        key = cache_key(pdf_data)
+        cached = pdf_cache.open_file(room_id, key)
+        if cached is not None:
+            return cached, os.fstat(cached.fileno()).st_size
+    data = render(**pdf_data)
+    if PDF_CACHE_ENABLED:
+        pdf_cache.put(room_id, key, data)
+    return io.BytesIO(data), len(data)
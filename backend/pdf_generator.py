@@ -1,4 +1,7 @@
+import functools
 import io
+import logging
+import threading
 from datetime import datetime
 from typing import List, Optional
 from reportlab.lib.pagesizes import A4
@@ -11,52 +14,118 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os
 
-def register_chinese_fonts():
-    """注册中文字体，带多种fallback选项和更强的错误处理"""
-    try:
-        # 尝试多个字体路径
-        font_paths = [
-            "C:/Windows/Fonts/msyh.ttc",        # 微软雅黑
-            "C:/Windows/Fonts/msyh.ttf",        # 微软雅黑 TTF
-            "C:/Windows/Fonts/simhei.ttf",      # 黑体
-            "C:/Windows/Fonts/simsun.ttc",      # 宋体
-            "C:/Windows/Fonts/simsun.ttf",      # 宋体 TTF
-            "/System/Library/Fonts/PingFang.ttc",  # macOS
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
-        ]
-        
-        font_registered = False
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    print(f"尝试注册字体: {font_path}")
-                    pdfmetrics.registerFont(TTFont('SimHei', font_path))
-                    print(f"成功注册字体: {font_path}")
-                    font_registered = True
-                    break
-                else:
-                    print(f"字体文件不存在: {font_path}")
-            except Exception as e:
-                print(f"字体注册失败 {font_path}: {e}")
-                continue
-        
-        if not font_registered:
-            # 如果所有系统字体都失败，尝试创建一个简单的测试字体
-            try:
-                # 使用内置字体作为最终备用方案
-                print("所有系统字体都无法使用，使用内置字体作为备用")
-                return False
-            except Exception as e:
-                print(f"备用字体设置失败: {e}")
-                return False
-            
-    except Exception as e:
-        print(f"字体注册过程出错: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-    
-    return font_registered
+logger = logging.getLogger(__name__)
+
+CHINESE_FONT_NAME = 'SimHei'
+
+# PDF内容或版式修改后递增，使已缓存的PDF失效
+PDF_TEMPLATE_VERSION = 1
+
+# 中文字体候选路径，按顺序使用第一个能注册的字体
+DEFAULT_FONT_PATHS = [
+    "C:/Windows/Fonts/msyh.ttc",        # 微软雅黑
+    "C:/Windows/Fonts/msyh.ttf",        # 微软雅黑 TTF
+    "C:/Windows/Fonts/simhei.ttf",      # 黑体
+    "C:/Windows/Fonts/simsun.ttc",      # 宋体
+    "C:/Windows/Fonts/simsun.ttf",      # 宋体 TTF
+    "/System/Library/Fonts/PingFang.ttc",  # macOS
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",  # Debian/Ubuntu fonts-wqy-microhei
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",    # Debian/Ubuntu fonts-wqy-zenhei
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",  # CentOS/Fedora
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux（不含中文字形）
+]
+# 可通过环境变量 PDF_FONT_PATHS 指定字体文件（多个路径以 os.pathsep 分隔，Linux下为冒号）
+PDF_FONT_PATHS = [path for path in os.getenv("PDF_FONT_PATHS", "").split(os.pathsep) if path] or DEFAULT_FONT_PATHS
+
+_font_lock = threading.Lock()
+_font_name = None
+
+def _resolve_font() -> str:
+    for font_path in PDF_FONT_PATHS:
+        if not os.path.exists(font_path):
+            logger.debug("字体文件不存在: %s", font_path)
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(CHINESE_FONT_NAME, font_path))
+        except Exception as e:
+            logger.warning("字体注册失败 %s: %s", font_path, e)
+            continue
+        logger.info("已注册PDF中文字体: %s", font_path)
+        return CHINESE_FONT_NAME
+    logger.warning("没有可用的中文字体，PDF将使用Helvetica字体，可通过环境变量 PDF_FONT_PATHS 指定字体文件")
+    return 'Helvetica'
+
+def get_font_name() -> str:
+    """PDF使用的字体名，第一次调用时查找并注册字体，之后直接返回"""
+    global _font_name
+    if _font_name is None:
+        with _font_lock:
+            if _font_name is None:
+                _font_name = _resolve_font()
+    return _font_name
+
+def register_chinese_fonts() -> bool:
+    """注册中文字体（只在进程内第一次调用时解析字体文件），返回是否有可用的中文字体"""
+    return get_font_name() == CHINESE_FONT_NAME
+
+def _table_style(font_name: str, valign: str, *spans) -> TableStyle:
+    return TableStyle([
+        ('FONT', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), valign),
+    ] + [('SPAN', start, end) for start, end in spans])
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_styles(font_name: str) -> dict:
+    """按字体构建一次段落和表格样式，之后生成的PDF复用"""
+    styles = getSampleStyleSheet()
+    return {
+        # 标题样式
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontName=font_name,
+            fontSize=16,
+            alignment=TA_CENTER,
+            spaceAfter=20
+        ),
+        # 正文样式
+        'content': ParagraphStyle(
+            'CustomContent',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=10,
+            alignment=TA_LEFT
+        ),
+        'basic_info_table': _table_style(font_name, 'MIDDLE', ((1, 4), (3, 4))),  # 客户描摹跨列
+        'comm_table': _table_style(font_name, 'TOP', ((0, 0), (3, 0)), ((0, 1), (3, 1))),  # 标题、内容跨列
+        'feedback_table': _table_style(font_name, 'MIDDLE', ((1, 0), (3, 0))),  # 内容跨列
+        'issue_table': _table_style(font_name, 'MIDDLE'),
+        'delivery_table': _table_style(font_name, 'MIDDLE', ((1, 0), (3, 0))),  # 内容跨列
+    }
+
+@functools.lru_cache(maxsize=None)
+def _get_fallback_styles() -> dict:
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'Title',
+            parent=styles['Title'],
+            fontName='Helvetica-Bold',
+            fontSize=16,
+            alignment=TA_CENTER
+        ),
+        'normal': ParagraphStyle(
+            'Normal',
+            parent=styles['Normal'],
+            fontName='Helvetica',
+            fontSize=10
+        ),
+    }
 
 def create_room_communication_pdf(
     room_info: dict,
@@ -68,16 +137,11 @@ def create_room_communication_pdf(
 ) -> bytes:
     """生成房间沟通记录PDF"""
     
-    # 尝试注册中文字体
-    font_registered = register_chinese_fonts()
-    
-    # 根据字体注册情况选择字体
-    if font_registered:
-        font_name = 'SimHei'
-        print("使用中文字体生成PDF")
-    else:
-        font_name = 'Helvetica'
-        print("使用Helvetica字体生成PDF")
+    # 字体只在第一次生成时注册，没有中文字体时使用Helvetica
+    font_name = get_font_name()
+    styles = get_pdf_styles(font_name)
+    title_style = styles['title']
+    content_style = styles['content']
     
     # 创建PDF文档
     buffer = io.BytesIO()
@@ -90,28 +154,6 @@ def create_room_communication_pdf(
         rightMargin=2*cm
     )
     
-    # 样式设置
-    styles = getSampleStyleSheet()
-    
-    # 标题样式
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName=font_name,
-        fontSize=16,
-        alignment=TA_CENTER,
-        spaceAfter=20
-    )
-    
-    # 正文样式
-    content_style = ParagraphStyle(
-        'CustomContent',
-        parent=styles['Normal'],
-        fontName=font_name,
-        fontSize=10,
-        alignment=TA_LEFT
-    )
-    
     # 构建PDF内容
     story = []
     
@@ -130,14 +172,7 @@ def create_room_communication_pdf(
     ]
     
     basic_info_table = Table(basic_info_data, colWidths=[4*cm, 6*cm, 2.5*cm, 4*cm])
-    basic_info_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('SPAN', (1, 4), (3, 4)),  # 客户描摹跨列
-    ]))
+    basic_info_table.setStyle(styles['basic_info_table'])
     
     story.append(basic_info_table)
     story.append(Spacer(1, 20))
@@ -150,7 +185,8 @@ def create_room_communication_pdf(
     comm_data = [comm_header]
     
     # 按时间排序沟通记录
-    sorted_comms = sorted(communications, key=lambda x: x.get('communication_time', x.get('created_at', '')))
+    # communication_time 可能为空，此时按创建时间排序
+    sorted_comms = sorted(communications, key=lambda x: x.get('communication_time') or x.get('created_at') or '')
     
     comm_content = []
     for comm in sorted_comms:
@@ -174,15 +210,7 @@ def create_room_communication_pdf(
     comm_data.append([comm_text, '', '', ''])
     
     comm_table = Table(comm_data, colWidths=[16.5*cm])
-    comm_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('SPAN', (0, 0), (3, 0)),  # 标题跨列
-        ('SPAN', (0, 1), (3, 1)),  # 内容跨列
-    ]))
+    comm_table.setStyle(styles['comm_table'])
     
     story.append(comm_table)
     story.append(Spacer(1, 20))
@@ -200,14 +228,7 @@ def create_room_communication_pdf(
     feedback_data = [['客户核心诉求', feedback_text, '', '']]
     
     feedback_table = Table(feedback_data, colWidths=[3*cm, 13.5*cm])
-    feedback_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('SPAN', (1, 0), (3, 0)),  # 内容跨列
-    ]))
+    feedback_table.setStyle(styles['feedback_table'])
     
     story.append(feedback_table)
     story.append(Spacer(1, 20))
@@ -247,13 +268,7 @@ def create_room_communication_pdf(
         issue_data.append(['', '', ''])
     
     issue_table = Table(issue_data, colWidths=[8*cm, 4*cm, 4.5*cm])
-    issue_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
+    issue_table.setStyle(styles['issue_table'])
     
     story.append(issue_table)
     story.append(Spacer(1, 20))
@@ -274,34 +289,23 @@ def create_room_communication_pdf(
     
     delivery_data = [['预计交付时间', date_str, '', '']]
     delivery_table = Table(delivery_data, colWidths=[4*cm, 12.5*cm])
-    delivery_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), font_name),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('SPAN', (1, 0), (3, 0)),  # 内容跨列
-    ]))
+    delivery_table.setStyle(styles['delivery_table'])
     
     story.append(delivery_table)
     
     # 生成PDF
     try:
-        print("开始构建PDF文档...")
-        print(f"使用字体: {font_name}")
         doc.build(story)
         buffer.seek(0)
         pdf_data = buffer.read()
-        print(f"PDF生成成功，大小: {len(pdf_data)} 字节")
+        logger.debug("PDF生成成功，字体: %s，大小: %d 字节", font_name, len(pdf_data))
         return pdf_data
     except Exception as e:
-        print(f"PDF构建失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("PDF构建失败")
         
         # 如果使用中文字体失败，尝试使用英文字体重新生成
-        if font_name == 'SimHei':
-            print("尝试使用Helvetica字体重新生成PDF...")
+        if font_name == CHINESE_FONT_NAME:
+            logger.warning("尝试使用Helvetica字体重新生成PDF")
             try:
                 # 重新生成，使用简化的内容和Helvetica字体
                 return create_fallback_pdf(
@@ -309,7 +313,7 @@ def create_room_communication_pdf(
                     quality_issues, assigned_users, latest_customer_description
                 )
             except Exception as fallback_e:
-                print(f"使用备用字体也失败: {fallback_e}")
+                logger.error("使用备用字体也失败: %s", fallback_e)
                 raise Exception(f"PDF生成失败: 中文字体错误 - {str(e)}, 备用字体错误 - {str(fallback_e)}")
         else:
             raise Exception(f"PDF生成失败: {str(e)}")
@@ -323,8 +327,6 @@ def create_fallback_pdf(
     latest_customer_description: str = ""
 ) -> bytes:
     """使用Helvetica字体生成简化版PDF的备用方案"""
-    print("使用备用方案生成PDF...")
-    
     # 创建PDF文档
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -337,21 +339,9 @@ def create_fallback_pdf(
     )
     
     # 使用简单的样式
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Title'],
-        fontName='Helvetica-Bold',
-        fontSize=16,
-        alignment=TA_CENTER
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontName='Helvetica',
-        fontSize=10
-    )
+    styles = _get_fallback_styles()
+    title_style = styles['title']
+    normal_style = styles['normal']
     
     # 构建简化的PDF内容
     story = []
@@ -387,5 +377,5 @@ def create_fallback_pdf(
     doc.build(story)
     buffer.seek(0)
     pdf_data = buffer.read()
-    print(f"备用PDF生成成功，大小: {len(pdf_data)} 字节")
+    logger.info("备用PDF生成成功，大小: %d 字节", len(pdf_data))
     return pdf_data
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+在独立的进程池中生成PDF
+
+ReportLab生成PDF是CPU密集型操作，在接口线程中执行时几个同时进行的导出就会占满API进程。
+PDF改为在进程池中生成，进程数默认为CPU核数；正在生成和排队等待的任务总数有上限，
+超过上限时抛出 PdfRenderQueueFull，接口返回503并通过 Retry-After 提示稍后重试。
+PDF_RENDER_WORKERS=0 时在调用线程中直接生成（仍受并发上限约束）。
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+import pdf_generator
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+# 除正在生成的任务外最多排队等待的任务数
+PDF_RENDER_QUEUE_SIZE = int(os.getenv("PDF_RENDER_QUEUE_SIZE", str(max(PDF_RENDER_WORKERS, 1) * 2)))
+# 等待生成结果的超时时间（秒）
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+# 队列已满时建议客户端重试的等待时间（秒）
+PDF_RENDER_RETRY_AFTER = int(os.getenv("PDF_RENDER_RETRY_AFTER", "5"))
+
+class PdfRenderQueueFull(Exception):
+    """正在生成和排队的PDF任务数已达上限"""
+
+class PdfRenderStats:
+    """PDF生成任务统计：排队等待时间和生成时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.render_time_total = 0.0
+        self.render_time_max = 0.0
+
+    def record_submit(self):
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+
+    def record_reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record_finish(self, queue_wait: float = None, render_time: float = None):
+        """queue_wait 和 render_time 为None表示任务失败"""
+        with self._lock:
+            self.in_flight -= 1
+            if render_time is None:
+                self.failed += 1
+                return
+            self.completed += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.render_time_total += render_time
+            self.render_time_max = max(self.render_time_max, render_time)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": PDF_RENDER_WORKERS,
+                "queue_size": PDF_RENDER_QUEUE_SIZE,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "queue_wait_avg_ms": round(self.queue_wait_total / self.completed * 1000, 2) if self.completed else 0.0,
+                "queue_wait_max_ms": round(self.queue_wait_max * 1000, 2),
+                "render_time_avg_ms": round(self.render_time_total / self.completed * 1000, 2) if self.completed else 0.0,
+                "render_time_max_ms": round(self.render_time_max * 1000, 2)
+            }
+
+pdf_render_stats = PdfRenderStats()
+
+def _init_worker():
+    # 每个工作进程启动时注册一次字体
+    pdf_generator.register_chinese_fonts()
+
+def _render(pdf_data: dict):
+    """在工作进程中执行，返回PDF内容和生成耗时"""
+    started_at = time.perf_counter()
+    pdf_bytes = pdf_generator.create_room_communication_pdf(**pdf_data)
+    return pdf_bytes, time.perf_counter() - started_at
+
+class PdfRenderPool:
+    """按需创建工作进程的PDF生成进程池，用信号量限制正在生成和排队的任务总数"""
+
+    def __init__(self, workers: int = PDF_RENDER_WORKERS, queue_size: int = PDF_RENDER_QUEUE_SIZE):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # API进程中有多个线程，fork出的子进程可能继承其他线程持有的锁，因此使用spawn启动工作进程
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker
+                    )
+        return self._executor
+
+    def _release(self, _future=None):
+        self._slots.release()
+        metrics.pdf_render_in_flight.dec()
+
+    def render(self, wait: float = 0, **pdf_data) -> bytes:
+        """生成PDF并等待结果，任务数已达上限且等待 wait 秒后仍无空位时抛出 PdfRenderQueueFull"""
+        acquired = self._slots.acquire(timeout=wait) if wait > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            pdf_render_stats.record_reject()
+            metrics.pdf_render_rejected_total.inc()
+            raise PdfRenderQueueFull()
+
+        submitted_at = time.perf_counter()
+        metrics.pdf_render_in_flight.inc()
+        pdf_render_stats.record_submit()
+        queue_wait = render_time = None
+        try:
+            if self.workers > 0:
+                try:
+                    executor = self._get_executor()
+                    future = executor.submit(_render, pdf_data)
+                except Exception:
+                    self._release()
+                    raise
+                # 名额在任务结束时归还，等待超时的任务仍在工作进程中执行，继续计入上限
+                future.add_done_callback(self._release)
+                try:
+                    pdf_bytes, render_time = future.result(timeout=PDF_RENDER_TIMEOUT)
+                except BrokenProcessPool:
+                    # 工作进程异常退出后进程池不可再用，下次重新创建
+                    with self._lock:
+                        if self._executor is executor:
+                            self._executor = None
+                    raise
+            else:
+                try:
+                    pdf_bytes, render_time = _render(pdf_data)
+                finally:
+                    self._release()
+            # 排队等待时间包括进程间传递参数和结果的时间
+            queue_wait = max(0.0, time.perf_counter() - submitted_at - render_time)
+            metrics.pdf_render_queue_wait_seconds.observe(queue_wait)
+            metrics.pdf_generation_duration_seconds.observe(render_time)
+            return pdf_bytes
+        finally:
+            pdf_render_stats.record_finish(queue_wait, render_time)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+pdf_render_pool = PdfRenderPool()
@@ -0,0 +1,278 @@
+"""
+管理员按需对单个请求进行性能分析（可通过环境变量 REQUEST_PROFILING=0 关闭）
+
+管理员请求时带上请求头 X-Profile: 1 或查询参数 profile=1，即对该请求开启分析：
+在处理该请求的线程上注册 sys.setprofile 回调，按采样间隔把耗时记到当时的调用栈上，
+请求结束后以折叠栈格式（flamegraph.pl、speedscope 可直接读取，权重单位为微秒）写入
+PROFILE_DIR 目录，只保留最近 PROFILE_KEEP 份，响应头 X-Profile-Id 返回分析结果的编号。
+
+事件循环线程上其他请求的代码按上下文变量区分，不计入本次分析；await 等待期间没有代码执行，
+也不计入，总耗时见分析结果中的 duration_ms。未带标记的请求不注册回调，没有额外开销。
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+import auth
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+REQUEST_PROFILING_ENABLED = os.getenv("REQUEST_PROFILING", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# 磁盘上保留的分析结果份数，超出时删除最早的
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# 采样间隔（毫秒），同一调用栈上累计超过该时间才记录一次
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+_current_profile = ContextVar("request_profile", default=None)
+
+def _frame_label(code) -> str:
+    filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})"
+
+class RequestProfile:
+    """单个请求的采样结果：调用栈 -> 累计耗时"""
+
+    def __init__(self, method: str, path: str, interval: float):
+        # 按时间排序即为记录的先后顺序
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = time.perf_counter()
+        self.duration = 0.0
+        self.status_code = None
+        self._lock = threading.Lock()
+        # (代码对象..., C函数名或None) -> 秒
+        self._samples = {}
+
+    def add_sample(self, frame, leaf, elapsed: float):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        key = (tuple(reversed(codes)), leaf)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0.0) + elapsed
+
+    def folded(self) -> str:
+        """折叠栈格式：每行为以分号连接的调用栈和耗时（微秒）"""
+        with self._lock:
+            samples = list(self._samples.items())
+        weights = {}
+        for (codes, leaf), elapsed in samples:
+            labels = [_frame_label(code) for code in codes]
+            if leaf:
+                labels.append(leaf)
+            stack = ";".join(labels)
+            weights[stack] = weights.get(stack, 0.0) + elapsed
+        lines = []
+        for stack, elapsed in sorted(weights.items()):
+            microseconds = round(elapsed * 1_000_000)
+            if microseconds > 0:
+                lines.append(f"{stack} {microseconds}\n")
+        return "".join(lines)
+
+    def metadata(self):
+        with self._lock:
+            sampled = sum(self._samples.values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "duration_ms": round(self.duration * 1000, 2),
+            "sampled_ms": round(sampled * 1000, 2),
+            "interval_ms": self.interval * 1000
+        }
+
+class _ThreadState(threading.local):
+    def __init__(self):
+        self.profile = None
+        self.last_time = 0.0
+        self.pending = 0.0
+
+_thread_state = _ThreadState()
+
+def _profile_callback(frame, event, arg):
+    now = time.perf_counter()
+    profile = _current_profile.get()
+    state = _thread_state
+    if profile is None or profile is not state.profile:
+        # 上一个事件之后执行的是其他请求（或事件循环本身）的代码
+        state.profile = profile
+        state.pending = 0.0
+    else:
+        state.pending += now - state.last_time
+        if state.pending >= profile.interval:
+            if event == "call":
+                # 进入函数之前的时间花在调用方
+                profile.add_sample(frame.f_back, None, state.pending)
+            elif event in ("c_return", "c_exception"):
+                profile.add_sample(frame, getattr(arg, "__qualname__", None) or repr(arg), state.pending)
+            else:
+                profile.add_sample(frame, None, state.pending)
+            state.pending = 0.0
+    # 不计入回调自身的耗时
+    state.last_time = time.perf_counter()
+
+class _LoopProfiler:
+    """在事件循环线程上注册回调，多个请求同时分析时共用"""
+
+    def __init__(self):
+        self._active = 0
+        self._previous = None
+
+    def start(self):
+        if self._active == 0:
+            self._previous = sys.getprofile()
+            sys.setprofile(_profile_callback)
+        self._active += 1
+
+    def stop(self):
+        self._active -= 1
+        if self._active == 0:
+            sys.setprofile(self._previous)
+            self._previous = None
+
+_loop_profiler = _LoopProfiler()
+
+def _profiled_endpoint(call):
+    """同步接口在线程池中执行，需要在执行线程上单独注册回调"""
+    if asyncio.iscoroutinefunction(call):
+        return call
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        if _current_profile.get() is None:
+            return call(*args, **kwargs)
+        previous = sys.getprofile()
+        sys.setprofile(_profile_callback)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            sys.setprofile(previous)
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """支持按需分析的路由，在创建应用后设置为 app.router.route_class"""
+
+    def get_route_handler(self):
+        self.dependant.call = _profiled_endpoint(self.dependant.call)
+        return super().get_route_handler()
+
+def _profile_path(profile_id: str, suffix: str) -> str:
+    if not profile_id.replace("-", "").isalnum():
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+    return os.path.join(PROFILE_DIR, f"{profile_id}{suffix}")
+
+def save_profile(profile: RequestProfile):
+    """写入分析结果，只保留最近 PROFILE_KEEP 份"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_profile_path(profile.id, ".folded"), "w", encoding="utf-8") as f:
+        f.write(profile.folded())
+    with open(_profile_path(profile.id, ".json"), "w", encoding="utf-8") as f:
+        json.dump(profile.metadata(), f, ensure_ascii=False)
+
+    saved = sorted(name[:-len(".json")] for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for profile_id in saved[:max(0, len(saved) - PROFILE_KEEP)]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(_profile_path(profile_id, suffix))
+            except FileNotFoundError:
+                pass
+
+def list_profiles():
+    """磁盘上保留的分析结果，最新的在前"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def read_profile(profile_id: str) -> str:
+    try:
+        with open(_profile_path(profile_id, ".folded"), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER.encode() and value == b"1":
+            return True
+    query = scope.get("query_string", b"")
+    return bool(query) and parse_qs(query.decode("latin-1")).get(PROFILE_QUERY_PARAM) == ["1"]
+
+async def _is_admin(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            break
+    else:
+        return False
+    if scheme.lower() != "bearer" or not token:
+        return False
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await auth.get_current_user(token, db)
+        except HTTPException:
+            return False
+    return user.role == "admin"
+
+class ProfilerMiddleware:
+    """对带分析标记的管理员请求开启分析的ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profile_requested(scope) or not await _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], PROFILE_INTERVAL_MS / 1000)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        _loop_profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _loop_profiler.stop()
+            _current_profile.reset(token)
+            profile.duration = time.perf_counter() - profile.started_at
+            try:
+                save_profile(profile)
+            except OSError:
+                logger.exception("保存性能分析结果失败: %s", profile.id)
+            logger.info("已记录请求性能分析 %s: %s %s 耗时 %.1fms",
+                        profile.id, profile.method, profile.path, profile.duration * 1000)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+重建房间汇总表(room_summary)
+从质量问题和沟通记录重新计算所有房间的汇总数据，并报告与现有数据的差异
+
+用法：
+    python rebuild_room_summary.py           # 校验并重建
+    python rebuild_room_summary.py --check   # 仅校验，不写入
+"""
+import sys
+from database import SessionLocal
+import models
+import crud
+from migrations import run_migrations
+
+SUMMARY_FIELDS = [
+    'pending_issues_count', 'latest_issue_description', 'latest_issue_type',
+    'latest_issue_record_date', 'pending_communications_count',
+    'latest_comm_content', 'latest_comm_time', 'latest_feedback'
+]
+
+def find_mismatches(db):
+    """比较room_summary表与重新计算的结果，返回不一致的房间列表"""
+    computed = crud._compute_room_summaries(db)
+    stored = {summary.room_id: summary for summary in db.query(models.RoomSummary).all()}
+    
+    mismatches = []
+    for room in db.query(models.Room).all():
+        expected = computed.get(room.id) or crud._summary_fields()
+        summary = stored.get(room.id)
+        if summary is None:
+            mismatches.append((room, ['缺少汇总数据']))
+            continue
+        diff = [field for field in SUMMARY_FIELDS if getattr(summary, field) != expected[field]]
+        if diff:
+            mismatches.append((room, diff))
+    return mismatches
+
+def main():
+    check_only = "--check" in sys.argv[1:]
+    # 创建缺少的表并执行未执行的迁移，旧数据库缺少的字段在此补齐
+    run_migrations()
+    db = SessionLocal()
+    
+    try:
+        mismatches = find_mismatches(db)
+        if mismatches:
+            print(f"⚠️  发现 {len(mismatches)} 个房间的汇总数据不一致:")
+            for room, fields in mismatches:
+                print(f"   {room.building_unit}-{room.room_number}: {', '.join(fields)}")
+        else:
+            print("✅ 房间汇总数据与明细数据一致")
+        
+        if check_only:
+            return 1 if mismatches else 0
+        
+        count = crud.rebuild_room_summaries(db)
+        print(f"🎉 已重建 {count} 个房间的汇总数据")
+        return 0
+    except Exception as e:
+        print(f"❌ 重建失败: {e}")
+        raise e
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
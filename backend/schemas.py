@@ -97,6 +97,18 @@ class QualityIssueUpdate(BaseModel):
     issue_type: Optional[str] = None
     record_date: Optional[datetime] = None
 
+class QualityIssueBatchAccept(BaseModel):
+    issue_ids: List[int]
+    
+    @field_validator('issue_ids')
+    @classmethod
+    def validate_issue_ids(cls, v):
+        if not v:
+            raise ValueError('请至少选择一个质量问题')
+        if len(v) > 500:
+            raise ValueError('单次最多验收500个质量问题')
+        return v
+
 class QualityIssue(QualityIssueBase):
     id: int
     user_id: int
@@ -111,6 +123,10 @@ class QualityIssue(QualityIssueBase):
     user_name: Optional[str] = None
     user_role: Optional[str] = None
     
+    # 验收人相关字段
+    acceptor_name: Optional[str] = None
+    acceptor_role: Optional[str] = None
+    
     is_verified: Optional[bool] = None
     
     def model_post_init(self, __context) -> None:
@@ -0,0 +1,152 @@
+"""
+慢查询日志（可通过环境变量 SLOW_QUERY_LOG=0 关闭）
+
+执行时间超过 SLOW_QUERY_MS 毫秒的SQL语句连同绑定参数、调用它的crud函数和
+EXPLAIN QUERY PLAN 的输出，以每行一条JSON的格式写入按大小轮转的日志文件，
+管理员可通过 /admin/slow-queries 查看最近的记录，用于确认查询是否用到了索引。
+"""
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG", "1") == "1"
+# 超过该执行时间（毫秒）的语句记为慢查询
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE", "logs/slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+
+# 记录参数时字符串的最大长度
+_MAX_PARAM_LENGTH = 200
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+# 慢查询单独写入轮转日志文件，不混入应用日志
+slow_query_logger = logging.getLogger("slow_queries")
+slow_query_logger.propagate = False
+
+def _setup_log_file():
+    if slow_query_logger.handlers:
+        return
+    directory = os.path.dirname(SLOW_QUERY_LOG_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(SLOW_QUERY_LOG_FILE, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                                  backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.INFO)
+
+def _format_param(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        return value if len(value) <= _MAX_PARAM_LENGTH else value[:_MAX_PARAM_LENGTH] + "..."
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return str(value)
+
+def _format_params(parameters):
+    if isinstance(parameters, dict):
+        return {key: _format_param(value) for key, value in parameters.items()}
+    return [_format_param(value) for value in parameters or ()]
+
+def find_caller():
+    """调用语句的crud函数（有嵌套时从外到内以 > 连接），没有时取最近的应用模块函数，格式为 模块.函数:行号"""
+    frame = sys._getframe(1)
+    crud_frames = []
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        if module == "crud":
+            crud_frames.append(f"crud.{frame.f_code.co_name}:{frame.f_lineno}")
+        elif (fallback is None and module not in (__name__, "database")
+                and os.path.dirname(os.path.abspath(frame.f_globals.get("__file__") or "")) == _APP_DIR):
+            fallback = f"{module}.{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    if crud_frames:
+        return " > ".join(reversed(crud_frames))
+    return fallback
+
+def explain_query_plan(conn, statement: str, parameters):
+    """在执行语句的连接上获取SQLite查询计划，按层级缩进"""
+    if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f"获取查询计划失败: {e}"]
+
+    depths = {0: -1}
+    plan = []
+    for node_id, parent_id, _, detail in rows:
+        depths[node_id] = depths.get(parent_id, -1) + 1
+        plan.append("  " * depths[node_id] + detail)
+    return plan
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("slow_query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+
+    # executemany 只记录第一组参数
+    first_parameters = parameters[0] if executemany and parameters else parameters
+    entry = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "duration_ms": round(elapsed * 1000, 2),
+        "statement": statement,
+        "parameters": _format_params(first_parameters),
+        "executemany": len(parameters) if executemany else None,
+        "caller": find_caller(),
+        "plan": explain_query_plan(conn, statement, first_parameters)
+    }
+    try:
+        slow_query_logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+    except Exception:
+        logger.exception("写入慢查询日志失败")
+
+def instrument_engine(engine):
+    """在引擎上注册慢查询记录，异步引擎传入 async_engine.sync_engine"""
+    if not SLOW_QUERY_LOG_ENABLED:
+        return
+    _setup_log_file()
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def recent_slow_queries(limit: int = 50):
+    """最近的慢查询记录（包括已轮转的日志文件），最新的在前"""
+    entries = []
+    paths = [SLOW_QUERY_LOG_FILE] + [f"{SLOW_QUERY_LOG_FILE}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+    for path in paths:
+        if len(entries) >= limit:
+            break
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            continue
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(entries) >= limit:
+                break
+    return entries
@@ -0,0 +1,158 @@
+"""
+按请求统计SQL语句（可通过环境变量 SQL_MONITOR=0 关闭）
+
+通过引擎事件记录每条语句的耗时，中间件把当前请求执行的语句数和数据库耗时写入响应头
+X-SQL-Count / X-SQL-Time-Ms。同一结构的语句在一个请求内重复超过阈值时视为疑似N+1查询，
+记录警告日志并通过 X-SQL-Repeated 响应头标出重复次数。各路由的汇总数据供管理员接口查看。
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SQL_MONITOR_ENABLED = os.getenv("SQL_MONITOR", "1") == "1"
+# 同一结构的语句在单个请求中执行超过该次数时视为疑似N+1查询
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """语句结构：去掉字面量、合并IN列表的占位符和空白，参数不同的同类语句得到相同结果"""
+    shape = _LITERAL.sub("?", statement)
+    shape = _IN_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+class RequestSqlStats:
+    """单个请求内执行的SQL统计"""
+
+    __slots__ = ("count", "db_time", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.db_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def most_repeated(self):
+        """返回 (语句结构, 次数)，没有语句时返回 (None, 0)"""
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+_current_request = ContextVar("sql_monitor_request", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        conn.info.setdefault("sql_monitor_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_request.get()
+    if stats is None:
+        return
+    started = conn.info.get("sql_monitor_started")
+    if started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+def instrument_engine(engine):
+    """在引擎上注册语句计时事件，异步引擎传入 async_engine.sync_engine"""
+    if not SQL_MONITOR_ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class RouteSqlStats:
+    """按路由汇总请求的SQL语句数、数据库耗时和疑似N+1查询次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route: str, stats: RequestSqlStats, repeated_shape: str, repeated_count: int):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    "requests": 0, "statements": 0, "statements_max": 0,
+                    "db_time": 0.0, "db_time_max": 0.0,
+                    "n_plus_one_requests": 0, "last_repeated_statement": None, "last_repeated_count": 0
+                }
+            entry["requests"] += 1
+            entry["statements"] += stats.count
+            entry["statements_max"] = max(entry["statements_max"], stats.count)
+            entry["db_time"] += stats.db_time
+            entry["db_time_max"] = max(entry["db_time_max"], stats.db_time)
+            if repeated_count > SQL_N_PLUS_ONE_THRESHOLD:
+                entry["n_plus_one_requests"] += 1
+                entry["last_repeated_statement"] = repeated_shape
+                entry["last_repeated_count"] = repeated_count
+
+    def summary(self):
+        """各路由的汇总数据，按数据库总耗时从高到低排序"""
+        with self._lock:
+            routes = [(route, dict(entry)) for route, entry in self._routes.items()]
+        result = []
+        for route, entry in sorted(routes, key=lambda item: item[1]["db_time"], reverse=True):
+            requests = entry["requests"]
+            result.append({
+                "route": route,
+                "requests": requests,
+                "statements_avg": round(entry["statements"] / requests, 2),
+                "statements_max": entry["statements_max"],
+                "db_time_avg_ms": round(entry["db_time"] / requests * 1000, 2),
+                "db_time_max_ms": round(entry["db_time_max"] * 1000, 2),
+                "db_time_total_ms": round(entry["db_time"] * 1000, 2),
+                "n_plus_one_requests": entry["n_plus_one_requests"],
+                "last_repeated_statement": entry["last_repeated_statement"],
+                "last_repeated_count": entry["last_repeated_count"]
+            })
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+route_sql_stats = RouteSqlStats()
+
+def route_name(request) -> str:
+    """请求对应的路由模板（如 GET /rooms/{room_id}），未匹配到路由时使用实际路径"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or request.url.path
+    return f"{request.method} {path}"
+
+async def sql_monitor_middleware(request, call_next):
+    if not SQL_MONITOR_ENABLED:
+        return await call_next(request)
+
+    stats = RequestSqlStats()
+    token = _current_request.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_request.reset(token)
+
+    route = route_name(request)
+    repeated_shape, repeated_count = stats.most_repeated()
+    route_sql_stats.record(route, stats, repeated_shape, repeated_count)
+
+    response.headers["X-SQL-Count"] = str(stats.count)
+    response.headers["X-SQL-Time-Ms"] = f"{stats.db_time * 1000:.2f}"
+    if repeated_count > SQL_N_PLUS_ONE_THRESHOLD:
+        response.headers["X-SQL-Repeated"] = str(repeated_count)
+        logger.warning(
+            "疑似N+1查询: %s 共执行 %d 条语句，同一语句重复 %d 次: %s",
+            route, stats.count, repeated_count, repeated_shape[:300]
+        )
+    logger.debug("%s sql_count=%d sql_time_ms=%.2f", route, stats.count, stats.db_time * 1000)
+    return response
@@ -2,6 +2,8 @@
 验证API数据结构
 """
 
+import base64
+import json
 import requests
 from database import SessionLocal
 import models
@@ -89,6 +91,42 @@ def verify_summary_api():
         print(f"验证过程中出现异常: {str(e)}")
         return False
 
+def verify_cursor_validation():
+    """验证伪造的分页游标返回400而不是500"""
+    print("\n=== 验证分页游标校验 ===")
+    
+    token = get_admin_token()
+    if not token:
+        print("无法获取管理员token")
+        return False
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    crafted_cursors = [
+        [{"a": 1}],
+        [[1], 2],
+        {"id": 1},
+        "不是游标",
+    ]
+    urls = [
+        "http://localhost:8000/admin/summary",
+        "http://localhost:8000/quality-issues/",
+        "http://localhost:8000/communications/",
+    ]
+    success = True
+    for url in urls:
+        for values in crafted_cursors:
+            if isinstance(values, str):
+                cursor = values
+            else:
+                cursor = base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+            response = requests.get(url, headers=headers, params={"cursor": cursor, "limit": 10})
+            if response.status_code == 400:
+                print(f"  ✓ {url} 游标 {values!r}: 400")
+            else:
+                print(f"  ✗ {url} 游标 {values!r}: {response.status_code} - {response.text}")
+                success = False
+    return success
+
 def verify_database_data():
     """直接验证数据库数据"""
     print("\n=== 验证数据库数据 ===")
@@ -149,6 +187,7 @@ if __name__ == "__main__":
     
     # 验证API返回
     success = verify_summary_api()
+    success = verify_cursor_validation() and success
     
     if success:
         print("\n✅ API验证完成")
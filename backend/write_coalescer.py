@@ -0,0 +1,181 @@
+"""
+高频小写入合并提交（可选功能，设置环境变量 WRITE_COALESCING=1 启用）
+
+批量录入期间每条质量问题、沟通记录都单独提交一次事务，SQLite同一时间只允许一个写入者，
+提交次数就是写入吞吐的上限。启用后这些写入交给后台线程：在一个很短的时间窗口内到达的
+写入合并为一个事务提交，再把各自的结果（含生成的ID）返回给调用方。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import crud
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+WRITE_COALESCING_ENABLED = os.getenv("WRITE_COALESCING", "0") == "1"
+# 收到第一条写入后最多再等待多久收集同批写入（毫秒）
+WRITE_COALESCE_WINDOW_MS = float(os.getenv("WRITE_COALESCE_WINDOW_MS", "5"))
+# 单个事务最多合并的写入数量
+WRITE_COALESCE_MAX_BATCH = int(os.getenv("WRITE_COALESCE_MAX_BATCH", "200"))
+# 调用方等待写入开始执行的超时时间（秒），超时仍在排队的写入被取消，不会再提交
+WRITE_COALESCE_TIMEOUT = float(os.getenv("WRITE_COALESCE_TIMEOUT", "30"))
+
+# 写入类型 -> (批量写入函数, 单条写入函数)，批量失败时逐条重做以定位出错的写入
+WRITE_HANDLERS = {
+    "quality_issue": (crud.create_quality_issues, crud.create_quality_issue),
+    "communication": (crud.create_communications, crud.create_communication),
+}
+
+_STOP = object()
+
+class WriteQueueTimeout(Exception):
+    """写入排队超时，已从队列中取消，不会被提交"""
+
+class WriteCoalescer:
+    """后台线程按时间窗口收集写入请求，每批一个事务提交"""
+
+    def __init__(self, window_ms: float = WRITE_COALESCE_WINDOW_MS, max_batch: int = WRITE_COALESCE_MAX_BATCH,
+                 session_factory=SessionLocal):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.session_factory = session_factory
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+        self.max_batch_seen = 0
+        self.commit_time_total = 0.0
+
+    def submit(self, kind: str, payload, user_id: int) -> Future:
+        """提交一条写入，返回的Future在所在批次提交后得到写入结果"""
+        if kind not in WRITE_HANDLERS:
+            raise ValueError(f"不支持合并的写入类型: {kind}")
+        self._ensure_started()
+        future = Future()
+        self._queue.put((kind, payload, user_id, future))
+        return future
+
+    def write(self, kind: str, payload, user_id: int):
+        """提交写入并等待结果
+
+        超时时仍在排队的写入被取消并抛出 WriteQueueTimeout；已开始提交的写入继续等待结果，
+        避免把随后仍会提交的写入报告为失败，导致客户端重试时重复写入
+        """
+        future = self.submit(kind, payload, user_id)
+        try:
+            return future.result(timeout=WRITE_COALESCE_TIMEOUT)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteQueueTimeout()
+            return future.result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+                self._thread.start()
+
+    def shutdown(self):
+        """处理完已提交的写入后停止后台线程"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _collect(self, first):
+        """从第一条写入开始，在时间窗口内继续收集，直到达到批量上限"""
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            by_kind = {}
+            for item in batch:
+                by_kind.setdefault(item[0], []).append(item)
+            for kind, items in by_kind.items():
+                self._flush(kind, items)
+
+    def _flush(self, kind: str, items):
+        # 跳过调用方已超时取消的写入，其余标记为执行中，此后不能再被取消
+        items = [item for item in items if item[3].set_running_or_notify_cancel()]
+        if not items:
+            return
+        batch_handler, single_handler = WRITE_HANDLERS[kind]
+        started_at = time.perf_counter()
+        # 返回的对象在会话关闭后仍需读取，提交时不能过期
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            results = batch_handler(db, [(payload, user_id) for _, payload, user_id, _ in items])
+        except Exception:
+            db.rollback()
+            logger.exception("合并写入失败，逐条重新写入 %d 条%s", len(items), kind)
+            results = None
+        finally:
+            db.close()
+
+        if results is None:
+            with self._stats_lock:
+                self.fallbacks += 1
+            for _, payload, user_id, future in items:
+                self._write_single(single_handler, payload, user_id, future)
+        else:
+            for (_, _, _, future), result in zip(items, results):
+                future.set_result(result)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(items)
+            self.max_batch_seen = max(self.max_batch_seen, len(items))
+            self.commit_time_total += time.perf_counter() - started_at
+
+    def _write_single(self, handler, payload, user_id: int, future: Future):
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            future.set_result(handler(db, payload, user_id))
+        except Exception as e:
+            db.rollback()
+            future.set_exception(e)
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "enabled": WRITE_COALESCING_ENABLED,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "fallbacks": self.fallbacks,
+                "avg_commit_ms": round(self.commit_time_total / self.batches * 1000, 2) if self.batches else 0.0
+            }
+
+write_coalescer = WriteCoalescer()
@@ -124,10 +124,24 @@ export const userAPI = {
 
 // 管理员相关API
 export const adminAPI = {
-  // 获取数据汇总
-  getSummary(buildingUnit) {
-    const params = buildingUnit ? { building_unit: buildingUnit } : {}
+  // 获取数据汇总（筛选、排序、分页参数由服务端处理）
+  getSummary(params = {}) {
     return api.get('/admin/summary', { params })
+  },
+
+  // 创建楼栋单元沟通记录PDF批量导出任务，返回任务ID和一次性下载地址
+  createBuildingUnitExport(buildingUnit) {
+    return api.post(`/admin/building-units/${encodeURIComponent(buildingUnit)}/export-jobs`)
+  },
+
+  // 查询批量导出任务的进度
+  getExportJob(jobId) {
+    return api.get(`/admin/export-jobs/${jobId}`)
+  },
+
+  // 下载地址由浏览器直接打开，压缩包边接收边保存，不在内存中缓存整个文件
+  getExportDownloadUrl(downloadPath) {
+    return `${api.defaults.baseURL}${downloadPath}`
   }
 }
 